@@ -0,0 +1,216 @@
+"""
+Asynchronous (ASGI) entry point for the external function API.
+
+It serves the same ``/functions/get_embedding`` contract as the Flask app in
+``external_function_api.py`` and can be run with::
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+
+OpenAI requests are made with ``AsyncOpenAI`` through the shared dispatcher,
+Hugging Face rows go through the shared micro-batcher and process pool, and
+the response body is streamed row by row as results become available.
+
+"""
+import asyncio
+import functools
+import json
+import os
+import time
+
+import external_function_api as api
+from openai import AsyncOpenAI
+from serialization import encode_row
+from serialization import encode_vectors
+
+# Number of rows serialized into each chunk of the streamed response
+stream_chunk_rows = int(os.environ.get('STREAM_CHUNK_ROWS', '64'))
+
+openai_client = None
+
+
+def startup():
+    """Create the OpenAI client, worker pools, micro-batcher and cache."""
+    global openai_client
+    if 'openai_embedding' in api.served_models:
+        openai_client = AsyncOpenAI(api_key=api.api_key, max_retries=0)
+        api.openai_dispatcher.async_client = openai_client
+    api.start_workers()
+
+
+async def embed_openai(texts, futures):
+    """Embed `texts` with OpenAI and resolve one future per text."""
+    index = api.valid_rows(texts)
+    results = [None] * len(texts)
+    if index:
+        embeddings, errors = await api.openai_dispatcher.aembed(
+            [texts[i] for i in index],
+        )
+        api.report_openai_errors(errors)
+        for i, embedding in zip(index, embeddings):
+            results[i] = embedding
+    for future, result in zip(futures, results):
+        future.set_result(result)
+
+
+def schedule_rows(rows):
+    """
+    Start embedding `(model_name, text)` rows and return one future per row.
+
+    Cache hits resolve immediately, Hugging Face rows are handed to the
+    micro-batcher and OpenAI rows are sent in a single request.
+
+    """
+    loop = asyncio.get_running_loop()
+    batcher = api.start_workers()
+    futures = [None] * len(rows)
+    batched, openai_rows = [], []
+
+    for i, (model_name, text) in enumerate(rows):
+        vector = None
+        # Rows of models not served here go to the micro-batcher, whose
+        # `process_batch` rejects them, whether they are cached or not
+        served = model_name in api.served_models
+        if api.cache is not None and served and isinstance(text, str):
+            vector = api.cache.get(model_name, text)
+        if vector is not None:
+            futures[i] = loop.create_future()
+            futures[i].set_result(vector)
+        elif model_name == 'openai_embedding' and served:
+            openai_rows.append(i)
+        else:
+            batched.append(i)
+
+    if batched:
+        submitted = batcher.submit([rows[i] for i in batched])
+        for i, future in zip(batched, submitted):
+            futures[i] = asyncio.wrap_future(future)
+
+    if openai_rows:
+        for i in openai_rows:
+            futures[i] = loop.create_future()
+        asyncio.create_task(
+            embed_openai(
+                [rows[i][1] for i in openai_rows],
+                [futures[i] for i in openai_rows],
+            ),
+        )
+
+    if api.cache is not None:
+        for i in batched + openai_rows:
+            futures[i].add_done_callback(functools.partial(cache_result, rows[i]))
+
+    return futures
+
+
+def cache_result(row, future):
+    """Add the result of a finished row to the embedding cache."""
+    if not future.cancelled() and future.exception() is None:
+        if future.result() is not None:
+            api.cache.put(*row, future.result())
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+async def send_json(send, status, content):
+    body = json.dumps(content).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def get_embedding(receive, send):
+    """ incoming data is this format :
+    {"data":
+    [[<row id>, <data string >, <model_name string>],
+    [<row id>, <data string >, <model_name string>],
+    ... ]}
+     """
+    start_time = time.time()
+    row_ids, rows = [], []
+    for row_id, data, model_name in json.loads(await read_body(receive))['data']:
+        row_ids.append(row_id)
+        rows.append((model_name, data))
+
+    futures = schedule_rows(rows)
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(b'content-type', b'application/json')],
+    })
+
+    # Stream rows in order as they complete instead of building the
+    # whole response in memory
+    chunk = ['{"data": [']
+    for n, (row_id, future) in enumerate(zip(row_ids, futures)):
+        try:
+            result = await future
+        except Exception as e:
+            print(f'Error in embedding processing: {e}')
+            result = None
+        if n:
+            chunk.append(', ')
+        text, = encode_vectors([result], api.vector_encoding, api.vector_precision)
+        chunk.append(encode_row(row_id, text))
+        if len(chunk) >= 2 * stream_chunk_rows:
+            await send({
+                'type': 'http.response.body',
+                'body': ''.join(chunk).encode('utf-8'),
+                'more_body': True,
+            })
+            chunk = []
+    chunk.append(']}')
+    await send({'type': 'http.response.body', 'body': ''.join(chunk).encode('utf-8')})
+
+    print(f'Time taken: {time.time() - start_time} seconds')
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            startup()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+
+    if api.batcher is None:
+        startup()
+
+    route = (scope['method'], scope['path'])
+    if route == ('POST', '/functions/get_embedding'):
+        await get_embedding(receive, send)
+    elif route == ('GET', '/health'):
+        await send_json(send, 200, dict(status='ok'))
+    elif route == ('GET', '/ready'):
+        report = api.startup_report()
+        await send_json(send, 200 if report['ready'] else 503, report)
+    elif route == ('GET', '/metrics'):
+        await send_json(send, 200, dict(
+            batcher=api.start_workers().metrics(),
+            cache=api.cache.metrics() if api.cache is not None else None,
+            openai=api.openai_dispatcher.metrics(),
+            startup=api.startup_report(),
+        ))
+    else:
+        await send_json(send, 404, dict(error='not found'))
@@ -0,0 +1,181 @@
+"""Request-coalescing micro-batcher for the external function API."""
+import collections
+import functools
+import threading
+import time
+from concurrent.futures import Future
+
+
+def percentile(values, q):
+    """Return the `q`-th percentile (0-100) of `values` (nearest rank)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, round(q / 100 * len(values)) - 1))
+    return values[k]
+
+
+class MicroBatcher:
+    """
+    Merge rows from concurrent requests into model-sized batches.
+
+    Rows are queued per model name. A background thread dispatches a queue
+    to `handler(texts, model_name)` as soon as it holds `max_batch_size`
+    rows or its oldest row has waited `max_wait` seconds, whichever comes
+    first. The handler must return one result per text; each result is
+    delivered to the future returned for that row by :meth:`submit`.
+
+    If `executors` maps a model name to an executor, batches for that model
+    are submitted to it so that batches of different models run in
+    parallel and the dispatch thread never blocks on a model. Batches for
+    other model names are handled inline.
+
+    Parameters
+    ----------
+    handler : Callable[[list[str], str], list[Any]]
+        Function that embeds a homogeneous batch of texts
+    max_batch_size : int
+        Maximum number of rows handed to `handler` at once
+    max_wait : float
+        Maximum time in seconds a row waits for its batch to fill up
+    history : int
+        Number of recent rows and batches kept for the metrics
+    executors : dict[str, Executor], optional
+        Long-lived executors keyed by model name
+
+    """
+
+    def __init__(
+        self, handler, max_batch_size=1024, max_wait=0.005,
+        history=10000, executors=None,
+    ):
+        self.handler = handler
+        self.executors = executors or {}
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queues = collections.defaultdict(collections.deque)
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._started = time.monotonic()
+        self._waits = collections.deque(maxlen=history)
+        self._fills = collections.deque(maxlen=history)
+        self._requests = 0
+        self._rows = 0
+        self._batches = 0
+
+        self._thread = threading.Thread(
+            target=self._run, name='micro-batcher', daemon=True,
+        )
+        self._thread.start()
+
+    def submit(self, rows):
+        """
+        Queue `(model_name, text)` rows and return one future per row.
+
+        The futures resolve to the handler result for the row, in the same
+        order as `rows`, so callers can zip them back with their row ids.
+
+        """
+        now = time.monotonic()
+        futures = []
+        with self._cond:
+            if self._closed:
+                raise RuntimeError('batcher is closed')
+            for model_name, text in rows:
+                future = Future()
+                self._queues[model_name].append((now, text, future))
+                futures.append(future)
+            self._requests += 1
+            self._cond.notify()
+        return futures
+
+    def close(self):
+        """Flush pending rows and stop the dispatch thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+    def metrics(self):
+        """Return a snapshot of the latency and throughput counters."""
+        with self._cond:
+            waits = list(self._waits)
+            fills = list(self._fills)
+            elapsed = time.monotonic() - self._started
+            return dict(
+                requests=self._requests,
+                rows=self._rows,
+                batches=self._batches,
+                pending=sum(len(q) for q in self._queues.values()),
+                rows_per_second=self._rows / elapsed if elapsed else 0.0,
+                wait_p50_ms=percentile(waits, 50) * 1000,
+                wait_p99_ms=percentile(waits, 99) * 1000,
+                batch_fill_ratio=sum(fills) / len(fills) if fills else 0.0,
+                max_batch_size=self.max_batch_size,
+                max_wait_ms=self.max_wait * 1000,
+            )
+
+    def _next_batch(self):
+        """Wait for a queue that is full or past its deadline and pop a batch."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                deadline = None
+                for model_name, queue in self._queues.items():
+                    if not queue:
+                        continue
+                    due = queue[0][0] + self.max_wait
+                    if self._closed or len(queue) >= self.max_batch_size or due <= now:
+                        size = min(len(queue), self.max_batch_size)
+                        batch = [queue.popleft() for _ in range(size)]
+                        self._waits.extend(now - item[0] for item in batch)
+                        self._fills.append(size / self.max_batch_size)
+                        self._rows += size
+                        self._batches += 1
+                        return model_name, batch
+                    deadline = due if deadline is None else min(deadline, due)
+                if self._closed:
+                    return None
+                self._cond.wait(None if deadline is None else deadline - now)
+
+    def _run(self):
+        while True:
+            item = self._next_batch()
+            if item is None:
+                return
+            model_name, batch = item
+            self._dispatch(model_name, batch)
+
+    def _dispatch(self, model_name, batch):
+        texts = [text for _, text, _ in batch]
+        futures = [future for _, _, future in batch]
+        executor = self.executors.get(model_name)
+        try:
+            if executor is None:
+                done = Future()
+                done.set_result(self.handler(texts, model_name))
+            else:
+                done = executor.submit(self.handler, texts, model_name)
+        except Exception as exc:
+            done = Future()
+            done.set_exception(exc)
+        done.add_done_callback(functools.partial(self._deliver, futures))
+
+    @staticmethod
+    def _deliver(futures, done):
+        """Fan the results of a finished batch out to the per-row futures."""
+        try:
+            results = done.result()
+            if len(results) != len(futures):
+                raise RuntimeError(
+                    f'handler returned {len(results)} results '
+                    f'for {len(futures)} rows',
+                )
+        except Exception as exc:
+            for future in futures:
+                future.set_exception(exc)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the response encodings for embedding batches.
+
+Run it from the sample directory as python -m bench.encodings.
+
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from serialization import encode_response
+
+
+def encode_response_lists(row_ids, vectors):
+    """Reference implementation: `json.dumps` of Python float lists per row."""
+    res = [json.dumps(vector.tolist()) for vector in vectors]
+    return json.dumps(dict(data=list(zip(row_ids, res))))
+
+
+def timed(func, repeat):
+    """Return the best time of `repeat` runs and the last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--rows', type=int, default=1024)
+    parser.add_argument('-d', '--dims', default='384,1536')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    row_ids = list(range(args.rows))
+
+    for dim in map(int, args.dims.split(',')):
+        matrix = rng.standard_normal((args.rows, dim), dtype=np.float32)
+        matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+        vectors = list(matrix)
+
+        cases = [
+            ('json.dumps lists', lambda: encode_response_lists(row_ids, vectors)),
+            ('json precision=9', lambda: encode_response(row_ids, vectors, 'json', 9)),
+            ('json precision=6', lambda: encode_response(row_ids, vectors, 'json', 6)),
+            ('hex float32', lambda: encode_response(row_ids, vectors, 'hex')),
+        ]
+
+        print(f'{args.rows} x {dim}')
+        base = None
+        for name, func in cases:
+            elapsed, body = timed(func, args.repeat)
+            base = base or elapsed
+            print(
+                f'  {name:>18}: {elapsed * 1000:8.1f} ms '
+                f'{len(body) / 1e6:7.2f} MB ({base / elapsed:.1f}x)',
+            )
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+CPU benchmark for the Hugging Face embedding path of the external function API.
+
+Run it from the sample directory as python -m bench.hf_embedding.
+
+"""
+import argparse
+import random
+import time
+
+import hf_inference as hf
+import numpy as np
+import torch
+from hf_backends import load_backend
+from hf_backends import min_cosine_similarity
+
+WORDS = (
+    'the quick brown fox jumped over the lazy dog she sells seashells by '
+    'the seashore early bird gets the worm fortune favors the bold a penny '
+    'saved is a penny earned actions speak louder than words'
+).split()
+
+
+def make_texts(n, min_words=3, max_words=60, seed=0):
+    """Build `n` sentences of varying length from a fixed vocabulary."""
+    rng = random.Random(seed)
+    return [
+        ' '.join(rng.choices(WORDS, k=rng.randint(min_words, max_words)))
+        for _ in range(n)
+    ]
+
+
+def get_hf_embedding_per_text(texts):
+    """Reference implementation: one forward pass per text."""
+    embeddings = []
+    for text in texts:
+        inputs = hf.hf_tokenizer(
+            text, padding=True, truncation=True, return_tensors='pt',
+        )
+        with torch.no_grad():
+            embedding = hf.hf_model(**inputs).last_hidden_state.mean(dim=1)
+            norm = torch.linalg.vector_norm(embedding, ord=2, dim=1, keepdim=True)
+            embeddings.append((embedding / norm).squeeze().tolist())
+    return embeddings
+
+
+def timed(func, texts, repeat):
+    """Return the best rows/sec of `repeat` runs and the last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(texts)
+        best = min(best, time.perf_counter() - start)
+    return len(texts) / best, result
+
+
+def max_abs_diff(a, b):
+    return float(np.abs(np.asarray(a) - np.asarray(b)).max())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('-n', '--rows', type=int, default=1024)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument(
+        '-b', '--batch-sizes', default='8,16,32,64,128',
+        help='comma-separated micro-batch sizes to try',
+    )
+    parser.add_argument(
+        '--backends', default='eager,int8,onnx',
+        help='comma-separated inference backends to compare',
+    )
+    parser.add_argument('--threads', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    hf.load_model()
+    texts = make_texts(args.rows)
+    get_hf_embedding_per_text(texts[:8])  # warm up
+
+    print(f'model: {hf.model_name}')
+    print(f'rows: {len(texts)}, torch threads: {torch.get_num_threads()}')
+
+    base_rate, reference = timed(get_hf_embedding_per_text, texts, args.repeat)
+    print(f'{"per-text":>12}: {base_rate:10.1f} rows/sec')
+
+    eager = load_backend('eager', hf.hf_model, hf.hf_tokenizer)
+    for batch_size in map(int, args.batch_sizes.split(',')):
+        rate, result = timed(
+            lambda x: hf.get_hf_embedding(x, batch_size=batch_size, backend=eager),
+            texts, args.repeat,
+        )
+        print(
+            f'{"batch=" + str(batch_size):>12}: {rate:10.1f} rows/sec '
+            f'({rate / base_rate:.1f}x, max diff {max_abs_diff(result, reference):.2e})',
+        )
+
+    print(f'backends at batch={hf.hf_batch_size}:')
+    for name in args.backends.split(','):
+        backend = load_backend(
+            name, hf.hf_model, hf.hf_tokenizer, hf.hf_onnx_path,
+            torch.get_num_threads(),
+        )
+        hf.get_hf_embedding(texts[:8], backend=backend)  # warm up
+        rate, result = timed(
+            lambda x: hf.get_hf_embedding(x, backend=backend), texts, args.repeat,
+        )
+        print(
+            f'{name:>12}: {rate:10.1f} rows/sec ({rate / base_rate:.1f}x, '
+            f'min cosine {min_cosine_similarity(result, reference):.5f})',
+        )
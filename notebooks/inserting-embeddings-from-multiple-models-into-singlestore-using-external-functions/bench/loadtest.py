@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Load-test harness for the external function API.
+
+Sub-commands:
+
+fake-openai
+    Serve a local stand-in for the OpenAI embeddings endpoint with
+    configurable latency and error rate.
+replay
+    Send external-function payloads to a running server at a target rate
+    and model mix, and report throughput and latency percentiles.
+run
+    Start a fake OpenAI endpoint and the server (Flask or ASGI) pointed at
+    it, replay traffic, and also report the server's peak RSS.
+
+Run it from the sample directory, which holds the modules it imports.
+It is kept in bench/ so that it is not packaged with the sample.
+
+Example::
+
+    python -m bench.loadtest run --server flask --rate 20 --duration 30 \\
+        --mix hf_embedding=0.5,openai_embedding=0.5
+
+"""
+import argparse
+import array
+import base64
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+from batcher import percentile
+
+# The sample directory with the servers, one up from bench/
+APP_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    'the quick brown fox jumped over the lazy dog she sells seashells by '
+    'the seashore early bird gets the worm fortune favors the bold a penny '
+    'saved is a penny earned actions speak louder than words'
+).split()
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """Answer `POST /v1/embeddings` with random unit vectors."""
+
+    latency = 0.05
+    jitter = 0.02
+    error_rate = 0.0
+    vectors = [[0.0] * 1536]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        time.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500, 503])
+            self.send_json(status, dict(error=dict(message='injected', code=status)))
+            return
+
+        texts = body['input']
+        if isinstance(texts, str):
+            texts = [texts]
+
+        data = []
+        for i, text in enumerate(texts):
+            vector = self.vectors[hash(text) % len(self.vectors)]
+            if body.get('encoding_format') == 'base64':
+                vector = base64.b64encode(array.array('f', vector).tobytes()).decode()
+            data.append(dict(object='embedding', index=i, embedding=vector))
+
+        tokens = sum(len(x.split()) for x in texts)
+        self.send_json(200, dict(
+            object='list', data=data, model=body.get('model'),
+            usage=dict(prompt_tokens=tokens, total_tokens=tokens),
+        ))
+
+    def send_json(self, status, content):
+        payload = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_fake_openai(port=0, latency=0.05, jitter=0.02, error_rate=0.0, dim=1536):
+    """Start the fake OpenAI endpoint in a thread and return the server."""
+    rng = random.Random(0)
+    vectors = [[rng.gauss(0, 1) for _ in range(dim)] for _ in range(64)]
+    handler = type('Handler', (FakeOpenAIHandler,), dict(
+        latency=latency, jitter=jitter, error_rate=error_rate, vectors=vectors,
+    ))
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def parse_mix(mix):
+    """Parse `model=weight,...` into a list of (model, weight)."""
+    out = []
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        out.append((name.strip(), float(weight or 1)))
+    return out
+
+
+def make_payload(rows, mix, rng, start_id=0):
+    """Build an external-function request body with `rows` rows."""
+    models = [m for m, _ in mix]
+    weights = [w for _, w in mix]
+    data = []
+    for i in range(rows):
+        text = ' '.join(rng.choices(WORDS, k=rng.randint(3, 40)))
+        data.append([start_id + i, text, rng.choices(models, weights)[0]])
+    return json.dumps(dict(data=data)).encode('utf-8')
+
+
+def process_tree_rss(pid):
+    """Return the summed resident set size in bytes of `pid` and its children."""
+    total = 0
+    pids = [pid]
+    while pids:
+        p = pids.pop()
+        try:
+            with open(f'/proc/{p}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+            for tid in os.listdir(f'/proc/{p}/task'):
+                with open(f'/proc/{p}/task/{tid}/children') as f:
+                    pids.extend(int(x) for x in f.read().split())
+        except OSError:
+            continue
+    return total
+
+
+class RSSMonitor(threading.Thread):
+    """Sample the RSS of a process tree and keep the peak."""
+
+    def __init__(self, pid, interval=0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            self.peak = max(self.peak, process_tree_rss(self.pid))
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+        return self.peak
+
+
+def replay(url, rate, duration, rows, mix, concurrency=32, seed=0, timeout=60):
+    """
+    Send payloads to `url` at `rate` requests/sec for `duration` seconds.
+
+    Requests are scheduled open-loop, so a slow server builds up a backlog
+    instead of lowering the offered load.
+
+    """
+    rng = random.Random(seed)
+    total = int(rate * duration)
+    payloads = [make_payload(rows, mix, rng, i * rows) for i in range(min(total, 64))]
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def send(payload):
+        req = urllib.request.Request(
+            url, data=payload, headers={'Content-Type': 'application/json'},
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as res:
+                body = json.loads(res.read())
+            nulls = sum(1 for _, x in body['data'] if x is None)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if nulls:
+                    errors.append(f'{nulls} null rows')
+        except (urllib.error.URLError, OSError, ValueError) as exc:
+            with lock:
+                errors.append(str(exc))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, payloads[i % len(payloads)])
+    elapsed = time.perf_counter() - start
+
+    return dict(
+        requests=total,
+        completed=len(latencies),
+        failed=total - len(latencies),
+        rows_per_request=rows,
+        elapsed_s=elapsed,
+        requests_per_second=len(latencies) / elapsed,
+        rows_per_second=len(latencies) * rows / elapsed,
+        latency_p50_ms=percentile(latencies, 50) * 1000,
+        latency_p90_ms=percentile(latencies, 90) * 1000,
+        latency_p99_ms=percentile(latencies, 99) * 1000,
+        latency_max_ms=max(latencies, default=0) * 1000,
+        errors=sorted(set(errors))[:10],
+    )
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_ready(base_url, timeout=300):
+    """Poll the server's `/ready` endpoint until the models are warmed up."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f'{base_url}/ready', timeout=5) as res:
+                return json.loads(res.read())
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.2)
+    raise TimeoutError(f'{base_url} was not ready within {timeout}s')
+
+
+def start_server(kind, port, env, verbose=False):
+    """Start the Flask or ASGI server as a subprocess."""
+    if kind == 'asgi':
+        cmd = [
+            sys.executable, '-m', 'uvicorn', 'asgi_app:app',
+            '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning',
+        ]
+    else:
+        cmd = [
+            sys.executable, '-c',
+            'import external_function_api as api; api.start_workers(); '
+            f'api.app.run(host="127.0.0.1", port={port}, threaded=True)',
+        ]
+    output = None if verbose else subprocess.DEVNULL
+    return subprocess.Popen(
+        cmd, cwd=APP_DIRECTORY, env=env, stdout=output, stderr=output,
+    )
+
+
+def print_report(report):
+    for key, value in report.items():
+        if isinstance(value, float):
+            value = f'{value:.2f}'
+        print(f'{key:>22}: {value}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    fake = argparse.ArgumentParser(add_help=False)
+    fake.add_argument('--openai-latency', type=float, default=0.05)
+    fake.add_argument('--openai-jitter', type=float, default=0.02)
+    fake.add_argument('--openai-error-rate', type=float, default=0.0)
+    fake.add_argument('--openai-dim', type=int, default=1536)
+
+    load = argparse.ArgumentParser(add_help=False)
+    load.add_argument('--rate', type=float, default=10, help='requests per second')
+    load.add_argument('--duration', type=float, default=10, help='seconds')
+    load.add_argument('--rows', type=int, default=128, help='rows per request')
+    load.add_argument('--mix', default='hf_embedding=0.5,openai_embedding=0.5')
+    load.add_argument('--concurrency', type=int, default=32)
+    load.add_argument('--json', help='also write the report to this file')
+
+    p = sub.add_parser('fake-openai', parents=[fake])
+    p.add_argument('--port', type=int, default=8080)
+
+    p = sub.add_parser('replay', parents=[load])
+    p.add_argument('--url', default='http://127.0.0.1:5000/functions/get_embedding')
+    p.add_argument('--server-pid', type=int, help='report peak RSS of this process')
+
+    p = sub.add_parser('run', parents=[fake, load])
+    p.add_argument('--server', choices=['flask', 'asgi'], default='flask')
+    p.add_argument('--verbose', action='store_true', help='show server output')
+
+    args = parser.parse_args()
+
+    if args.command == 'fake-openai':
+        server = start_fake_openai(
+            args.port, args.openai_latency, args.openai_jitter,
+            args.openai_error_rate, args.openai_dim,
+        )
+        print(f'fake OpenAI listening on http://127.0.0.1:{args.port}/v1')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
+        return
+
+    mix = parse_mix(args.mix)
+    server = monitor = fake_openai = startup = None
+
+    if args.command == 'run':
+        fake_openai = start_fake_openai(
+            0, args.openai_latency, args.openai_jitter,
+            args.openai_error_rate, args.openai_dim,
+        )
+        port = free_port()
+        env = dict(
+            os.environ,
+            OPENAI_API_KEY='sk-loadtest',
+            OPENAI_BASE_URL=f'http://127.0.0.1:{fake_openai.server_port}/v1',
+        )
+        server = start_server(args.server, port, env, args.verbose)
+        url = f'http://127.0.0.1:{port}/functions/get_embedding'
+        startup = wait_until_ready(f'http://127.0.0.1:{port}')
+        monitor = RSSMonitor(server.pid)
+    else:
+        url = args.url
+        if args.server_pid:
+            monitor = RSSMonitor(args.server_pid)
+
+    try:
+        if monitor is not None:
+            monitor.start()
+        report = replay(
+            url, args.rate, args.duration, args.rows, mix, args.concurrency,
+        )
+        if monitor is not None:
+            report['server_peak_rss_mb'] = monitor.stop() / 2**20
+        if args.command == 'run':
+            report['server_ready_s'] = startup.get('ready_s')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if fake_openai is not None:
+            fake_openai.shutdown()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
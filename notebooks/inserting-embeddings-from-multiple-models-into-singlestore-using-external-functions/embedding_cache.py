@@ -0,0 +1,219 @@
+"""Content-addressed embedding cache with an in-memory LRU and an on-disk tier."""
+import collections
+import hashlib
+import mmap
+import os
+import re
+import threading
+import unicodedata
+import urllib.parse
+
+import numpy as np
+
+KEY_SIZE = hashlib.sha256().digest_size
+
+
+def text_digest(text):
+    """Return the sha256 digest of the normalized form of `text`."""
+    text = unicodedata.normalize('NFC', text).strip()
+    return hashlib.sha256(text.encode('utf-8')).digest()
+
+
+class DiskTier:
+    """
+    Append-only file of fixed-size float32 records for a single model.
+
+    Each record is a sha256 key followed by `dim` little-endian float32
+    values. The file is memory-mapped for reads and its key index is
+    rebuilt when it is opened, so a restarted server starts warm. A file
+    must only be written by one process at a time.
+
+    """
+
+    def __init__(self, path, dim, max_entries=None):
+        self.path = path
+        self.dim = dim
+        self.max_entries = max_entries
+        self.dtype = np.dtype([('key', f'S{KEY_SIZE}'), ('vector', '<f4', (dim,))])
+
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        # Drop a partially written trailing record
+        self._count = size // self.dtype.itemsize
+        if size != self._count * self.dtype.itemsize:
+            self._file.truncate(self._count * self.dtype.itemsize)
+
+        self._mmap = None
+        self._records = None
+        self._remap()
+        self.index = {
+            bytes(key): slot for slot, key in enumerate(self._records['key'])
+        }
+
+    def _remap(self):
+        if self._mmap is not None:
+            self._records = None
+            self._mmap.close()
+            self._mmap = None
+        if self._count:
+            self._mmap = mmap.mmap(
+                self._file.fileno(), self._count * self.dtype.itemsize,
+                access=mmap.ACCESS_READ,
+            )
+            self._records = np.frombuffer(self._mmap, dtype=self.dtype)
+        else:
+            self._records = np.empty(0, dtype=self.dtype)
+
+    def __len__(self):
+        return self._count
+
+    def get(self, key):
+        slot = self.index.get(key)
+        if slot is None:
+            return None
+        if slot >= len(self._records):
+            self._remap()
+        return np.array(self._records[slot]['vector'])
+
+    def put(self, key, vector):
+        if key in self.index:
+            return
+        if self.max_entries is not None and self._count >= self.max_entries:
+            return
+        record = np.zeros(1, dtype=self.dtype)
+        record['key'] = key
+        record['vector'] = vector
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(record.tobytes())
+        self._file.flush()
+        self.index[key] = self._count
+        self._count += 1
+
+    def close(self):
+        self._records = None
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+
+class EmbeddingCache:
+    """
+    Cache embeddings by `(model id, sha256 of normalized text)`.
+
+    Vectors are stored as float32 arrays in a bounded LRU. If `directory`
+    is given, every vector is also appended to a memory-mapped file per
+    model id in that directory and LRU misses fall back to it.
+
+    Callers pass the function name a vector was requested under, which
+    `model_ids` maps to the model that actually produces it (such as the
+    Hugging Face model id and its backend), so vectors of a replaced
+    model are never served for the same name.
+
+    Parameters
+    ----------
+    max_entries : int
+        Maximum number of vectors held in memory
+    directory : str, optional
+        Directory for the on-disk tier
+    max_disk_entries : int, optional
+        Maximum number of vectors stored per model on disk
+    model_ids : Dict[str, str], optional
+        Model id behind each function name; other names are their own id
+
+    """
+
+    def __init__(
+        self, max_entries=10000, directory=None, max_disk_entries=None,
+        model_ids=None,
+    ):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.model_ids = dict(model_ids or {})
+
+        self._lru = collections.OrderedDict()
+        self._disk = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                m = re.match(r'^(.+)\.(\d+)\.f32$', name)
+                if m:
+                    model_id = urllib.parse.unquote(m.group(1))
+                    self._open_disk_tier(model_id, int(m.group(2)))
+
+    def _open_disk_tier(self, model_id, dim):
+        # Model ids hold slashes and colons; quoting keeps them reversible
+        name = urllib.parse.quote(model_id, safe='')
+        path = os.path.join(self.directory, f'{name}.{dim}.f32')
+        tier = DiskTier(path, dim, self.max_disk_entries)
+        self._disk[model_id] = tier
+        return tier
+
+    def model_id(self, model_name):
+        """Return the id of the model behind the function `model_name`."""
+        return self.model_ids.get(model_name, model_name)
+
+    def get(self, model_name, text):
+        """Return the cached float32 vector for `text`, or None."""
+        key = (self.model_id(model_name), text_digest(text))
+        with self._lock:
+            vector = self._lru.get(key)
+            if vector is not None:
+                self._lru.move_to_end(key)
+                self.hits += 1
+                return vector
+            tier = self._disk.get(key[0])
+            vector = tier.get(key[1]) if tier is not None else None
+            if vector is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, vector)
+            return vector
+
+    def put(self, model_name, text, vector):
+        """Store the embedding of `text` produced by `model_name`."""
+        key = (self.model_id(model_name), text_digest(text))
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._insert(key, vector)
+            if self.directory:
+                tier = self._disk.get(key[0])
+                if tier is None:
+                    tier = self._open_disk_tier(key[0], len(vector))
+                if tier.dim == len(vector):
+                    tier.put(key[1], vector)
+
+    def _insert(self, key, vector):
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self.evictions += 1
+
+    def metrics(self):
+        """Return the hit, miss and eviction counters."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return dict(
+                hits=self.hits,
+                disk_hits=self.disk_hits,
+                misses=self.misses,
+                evictions=self.evictions,
+                hit_ratio=(self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                entries=len(self._lru),
+                disk_entries={k: len(v) for k, v in self._disk.items()},
+            )
+
+    def close(self):
+        with self._lock:
+            for tier in self._disk.values():
+                tier.close()
+            self._disk.clear()
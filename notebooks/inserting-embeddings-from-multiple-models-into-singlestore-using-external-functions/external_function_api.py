@@ -1,61 +1,280 @@
-import json
+import multiprocessing
+import os
+import threading
 import time
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
 
-import openai
-import torch
+from batcher import MicroBatcher
+from embedding_cache import EmbeddingCache
 from flask import Flask
 from flask import request
+from flask import Response
 from openai import OpenAI
-from transformers import AutoModel
-from transformers import AutoTokenizer
+from openai_dispatch import OpenAIDispatcher
+from serialization import encode_response
 
-# Set up OpenAI
-api_key = 'add your openai key'
-client = OpenAI(api_key=api_key)
+# Set up OpenAI; retries are handled by the dispatcher and the client is
+# created by start_workers
+api_key = os.environ.get('OPENAI_API_KEY')
+openai_dispatcher = OpenAIDispatcher(
+    max_concurrency=int(os.environ.get('OPENAI_CONCURRENCY', '8')),
+    requests_per_minute=int(os.environ.get('OPENAI_RPM', '0')) or None,
+    tokens_per_minute=int(os.environ.get('OPENAI_TPM', '0')) or None,
+    max_retries=int(os.environ.get('OPENAI_MAX_RETRIES', '6')),
+)
 
-# Load Hugging Face model
-model_name = 'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2'
-hf_model = AutoModel.from_pretrained(model_name)
-hf_tokenizer = AutoTokenizer.from_pretrained(model_name)
+# Models served by this replica; without hf_embedding torch is never imported
+served_models = os.environ.get(
+    'SERVED_MODELS', 'hf_embedding,openai_embedding',
+).split(',')
+
+# Load the models in the background as soon as the server starts rather
+# than on the first request
+warm_up = os.environ.get('WARM_UP', '1') != '0'
+
+# Size of the long-lived worker pools
+hf_workers = int(os.environ.get('HF_WORKERS', '1'))
+hf_threads = int(os.environ.get('HF_THREADS', '0'))
+openai_workers = int(os.environ.get('OPENAI_WORKERS', '8'))
+
+# Response encoding of the vectors, see serialization.py
+vector_encoding = os.environ.get('VECTOR_ENCODING', 'json')
+vector_precision = int(os.environ.get('VECTOR_PRECISION', '9'))
+
+# Embedding cache; set EMBEDDING_CACHE_DIR to keep vectors across restarts
+cache_size = int(os.environ.get('EMBEDDING_CACHE_SIZE', '10000'))
+cache_dir = os.environ.get('EMBEDDING_CACHE_DIR')
+
+# Models behind each function name, which the cache keys vectors by so a
+# different model, backend or quantization never gets stale vectors. The
+# Hugging Face settings are read as in hf_inference.py, which is not
+# imported here as it pulls in torch.
+openai_model = 'text-embedding-ada-002'
+cache_model_ids = {
+    'openai_embedding': f'openai/{openai_model}',
+    'hf_embedding': 'hf/{}/{}'.format(
+        os.environ.get(
+            'HF_MODEL_NAME',
+            'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+        ),
+        os.environ.get('HF_BACKEND', 'eager'),
+    ),
+}
 
 # Hugging Face embedding function
 
 
 def get_hf_embedding(texts):
-    embeddings = []
-    for text in texts:
-        inputs = hf_tokenizer(text, padding=True, truncation=True, return_tensors='pt')
-        with torch.no_grad():
-            embedding = hf_model(**inputs).last_hidden_state.mean(dim=1)
-            norm = torch.linalg.vector_norm(embedding, ord=2, dim=1, keepdim=True)
-            normalized_embedding = embedding / norm
-            embeddings.append(normalized_embedding.squeeze().tolist())
-    return embeddings
+    """Embed texts with the Hugging Face model (see hf_inference.py)."""
+    # Imported here so that only the processes running the model pay for
+    # torch and transformers
+    import hf_inference
+    return hf_inference.get_hf_embedding(texts)
+
+
+def init_hf_worker(num_threads, load):
+    """Configure a Hugging Face worker process and optionally load the model."""
+    start = time.perf_counter()
+    import hf_inference
+    hf_inference.timings.setdefault('import_s', time.perf_counter() - start)
+    if num_threads:
+        hf_inference.torch.set_num_threads(num_threads)
+    if load:
+        hf_inference.warm_up()
+
+
+def hf_worker_timings():
+    """Return the startup timings of the worker process running this."""
+    import hf_inference
+    return dict(pid=os.getpid(), **hf_inference.timings)
 
 # OpenAI embedding function
 
 
 def get_ada_002_embedding(texts, model='text-embedding-ada-002'):
-    responses = openai.embeddings.create(input=texts, model=model)
-    return [response.embedding for response in responses.data]
+    """Return one float32 vector (or None if it failed) per text."""
+    embeddings, errors = openai_dispatcher.embed(texts, model)
+    report_openai_errors(errors)
+    return embeddings
+
+
+def report_openai_errors(errors):
+    for error in dict.fromkeys(str(x) for x in errors if x is not None):
+        print(f'Error in OpenAI processing: {error}')
+
+
+def valid_rows(batch):
+    """Return the positions of the non-empty strings in `batch`."""
+    return [
+        i for i, text in enumerate(batch)
+        if isinstance(text, str) and text.strip()
+    ]
 
 
 def process_batch(batch, model_name):
-    texts = [text for text in batch if isinstance(text, str) and text.strip()]
-    if not texts:
-        return []
+    """Embed `batch` with `model_name`, returning one result (or None) per row."""
+    results = [None] * len(batch)
+    index = valid_rows(batch)
+    if not index:
+        return results
+    texts = [batch[i] for i in index]
+    if model_name not in served_models:
+        print(f'Model not served by this replica: {model_name}')
+        return results
     if model_name == 'openai_embedding':
-        try:
-            return get_ada_002_embedding(texts, 'text-embedding-ada-002')
-        except Exception as e:
-            print(f'Error in OpenAI processing: {e}')
-            return []
+        embeddings = get_ada_002_embedding(texts, openai_model)
     elif model_name == 'hf_embedding':
-        return get_hf_embedding(texts)
+        embeddings = get_hf_embedding(texts)
     else:
         print(f'Invalid model name: {model_name}')
-        return []
+        return results
+    for i, embedding in zip(index, embeddings):
+        results[i] = embedding
+    return results
+
+
+batcher = None
+cache = None
+executors: dict = {}
+startup: dict = dict(started=None, ready=None, openai_client_s=None, hf_workers=[])
+_warm_ups: list = []
+_startup_lock = threading.Lock()
+_report_lock = threading.Lock()
+
+
+def start_workers():
+    """
+    Create the worker pools and the micro-batcher once per server process.
+
+    Torch inference runs in a process pool so it is not limited by the GIL,
+    OpenAI requests are I/O bound and run in a thread pool. Rows from
+    concurrent requests are merged into shared per-model batches and the
+    batches of different models run in parallel. Only the pools of
+    `served_models` are created, and with `warm_up` the model is loaded in
+    the background while the server already answers `/health`.
+
+    """
+    global batcher, cache
+    with _startup_lock:
+        if batcher is not None:
+            return batcher
+
+        startup['started'] = time.perf_counter()
+
+        if 'openai_embedding' in served_models:
+            start = time.perf_counter()
+            openai_dispatcher.client = OpenAI(api_key=api_key, max_retries=0)
+            startup['openai_client_s'] = time.perf_counter() - start
+            executors['openai_embedding'] = ThreadPoolExecutor(
+                max_workers=openai_workers,
+                thread_name_prefix='openai',
+            )
+
+        if 'hf_embedding' in served_models:
+            # Worker processes are spawned (torch is not fork-safe once its
+            # thread pools are running) and re-import this module, so
+            # nothing here may run at import time.
+            executors['hf_embedding'] = ProcessPoolExecutor(
+                max_workers=hf_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_hf_worker,
+                initargs=(hf_threads, warm_up),
+            )
+            if warm_up:
+                # Each task waits for the initializer of its worker
+                _warm_ups.extend(
+                    executors['hf_embedding'].submit(hf_worker_timings)
+                    for _ in range(hf_workers)
+                )
+
+        batcher = MicroBatcher(
+            process_batch,
+            max_batch_size=int(os.environ.get('BATCH_MAX_SIZE', '1024')),
+            max_wait=float(os.environ.get('BATCH_MAX_WAIT_MS', '5')) / 1000,
+            executors=executors,
+        )
+
+        if cache_size or cache_dir:
+            cache = EmbeddingCache(
+                max_entries=cache_size, directory=cache_dir,
+                model_ids=cache_model_ids,
+            )
+
+        if _warm_ups:
+            for future in _warm_ups:
+                future.add_done_callback(_warmed_up)
+        else:
+            startup['ready'] = time.perf_counter()
+
+        return batcher
+
+
+def _warmed_up(future):
+    with _report_lock:
+        if future.exception() is None:
+            startup['hf_workers'].append(future.result())
+        if startup['ready'] is None and all(x.done() for x in _warm_ups):
+            startup['ready'] = time.perf_counter()
+            print(f'Startup: {startup_report()}')
+
+
+def startup_report():
+    """
+    Return the readiness and startup timings of the server.
+
+    Each Hugging Face worker reports the seconds spent importing torch and
+    transformers, loading the weights, preparing the backend and running
+    the first inference.
+
+    """
+    errors = [str(x.exception()) for x in _warm_ups if x.done() and x.exception()]
+    report = dict(
+        ready=startup['ready'] is not None and not errors,
+        served_models=served_models,
+        openai_client_s=startup['openai_client_s'],
+        hf_workers=startup['hf_workers'],
+    )
+    if startup['ready'] is not None:
+        report['ready_s'] = startup['ready'] - startup['started']
+    if errors:
+        report['errors'] = errors
+    return report
+
+
+def embed_rows(rows):
+    """
+    Return one embedding (or None) per `(model_name, text)` row.
+
+    Cached rows are answered directly, the rest go through the
+    micro-batcher and their results are added to the cache. Rows of
+    models this replica does not serve are never answered from the cache,
+    which may be shared with other replicas; `process_batch` rejects them.
+
+    """
+    batcher = start_workers()
+    results = [None] * len(rows)
+    misses = []
+    for i, (model_name, text) in enumerate(rows):
+        vector = None
+        if cache is not None and model_name in served_models \
+                and isinstance(text, str):
+            vector = cache.get(model_name, text)
+        if vector is None:
+            misses.append(i)
+        else:
+            results[i] = vector
+
+    if not misses:
+        return results
+
+    futures = batcher.submit([rows[i] for i in misses])
+    for i, future in zip(misses, futures):
+        results[i] = future.result()
+        if cache is not None and results[i] is not None:
+            cache.put(*rows[i], results[i])
+
+    return results
 
 
 app = Flask(__name__)
@@ -70,27 +289,46 @@ def get_embedding():
     ... ]}
      """
     start_time = time.time()
-    row_ids, args, model_names = [], [], []
+    row_ids, rows = [], []
     for row_id, data, model_name in request.json['data']:
         row_ids.append(row_id)
-        args.append(data)
-        model_names.append(model_name)
-
-    batch_size = 1024
-    futures = []
-    with ThreadPoolExecutor(max_workers=len(args) // batch_size) as executor:
-        for i in range(0, len(args), batch_size):
-            batch = args[i:i + batch_size]
-            # Assuming all texts in the batch use the same model
-            model_name = model_names[i]
-            futures.append(executor.submit(process_batch, batch, model_name))
-
-    flat_results = [future.result() for future in futures]
+        rows.append((model_name, data))
+
+    results = embed_rows(rows)
+
     time_taken = time.time() - start_time
     app.logger.info(f'Time taken: {time_taken} seconds')
-    res = map(json.dumps, flat_results)
-    return dict(data=list(zip(row_ids, res)))
+    return Response(
+        encode_response(row_ids, results, vector_encoding, vector_precision),
+        mimetype='application/json',
+    )
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the server process is up and answering requests."""
+    return dict(status='ok')
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: the served models are loaded and warmed up."""
+    start_workers()
+    report = startup_report()
+    return report, 200 if report['ready'] else 503
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Report micro-batcher and cache counters."""
+    return dict(
+        batcher=start_workers().metrics(),
+        cache=cache.metrics() if cache is not None else None,
+        openai=openai_dispatcher.metrics(),
+        startup=startup_report(),
+    )
 
 
 if __name__ == '__main__':
+    start_workers()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,140 @@
+"""
+Inference backends for the Hugging Face embedding model.
+
+Each backend maps tokenized inputs to the model's last hidden state as a
+torch tensor, so pooling and normalization are shared by all of them:
+
+eager
+    The fp32 model as loaded by ``AutoModel``
+int8
+    The model with its ``Linear`` layers dynamically quantized to int8
+onnx
+    The model exported to ONNX and run with ONNX Runtime
+
+"""
+import inspect
+import os
+
+import torch
+
+
+class EagerBackend:
+    """Run the fp32 torch model."""
+
+    name = 'eager'
+
+    def __init__(self, model):
+        self.model = model.eval()
+
+    def __call__(self, inputs):
+        return self.model(**inputs).last_hidden_state
+
+
+class QuantizedBackend(EagerBackend):
+    """Run the model with dynamically quantized int8 ``Linear`` layers."""
+
+    name = 'int8'
+
+    def __init__(self, model):
+        super().__init__(
+            torch.quantization.quantize_dynamic(
+                model.eval(), {torch.nn.Linear}, dtype=torch.qint8,
+            ),
+        )
+
+
+class _PositionalInputs(torch.nn.Module):
+    """Expose the model's keyword inputs positionally for the ONNX export."""
+
+    def __init__(self, model, names):
+        super().__init__()
+        self.model = model
+        self.names = names
+
+    def forward(self, *args):
+        return self.model(**dict(zip(self.names, args))).last_hidden_state
+
+
+class OnnxBackend:
+    """
+    Run the model exported to ONNX with ONNX Runtime.
+
+    The export is written to `path` once and reused by later processes.
+
+    """
+
+    name = 'onnx'
+
+    def __init__(self, model, tokenizer, path, num_threads=None):
+        import onnxruntime
+
+        if not os.path.exists(path):
+            self.export(model, tokenizer, path)
+
+        options = onnxruntime.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=['CPUExecutionProvider'],
+        )
+        self.input_names = [x.name for x in self.session.get_inputs()]
+
+    @staticmethod
+    def export(model, tokenizer, path):
+        inputs = tokenizer(['export'], return_tensors='pt')
+        names = list(inputs.keys())
+        axes = {name: {0: 'batch', 1: 'sequence'} for name in names}
+        axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        kwargs = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            # The TorchScript exporter understands `dynamic_axes`
+            kwargs['dynamo'] = False
+        torch.onnx.export(
+            _PositionalInputs(model.eval(), names),
+            tuple(inputs[name] for name in names),
+            tmp_path,
+            input_names=names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=axes,
+            opset_version=13,
+            **kwargs,
+        )
+        # Another worker may be exporting at the same time
+        os.replace(tmp_path, path)
+
+    def __call__(self, inputs):
+        feed = {name: inputs[name].numpy() for name in self.input_names}
+        return torch.from_numpy(self.session.run(['last_hidden_state'], feed)[0])
+
+
+BACKENDS = ('eager', 'int8', 'onnx')
+
+
+def load_backend(name, model, tokenizer, onnx_path=None, num_threads=None):
+    """Return the backend called `name` for `model`."""
+    if name == 'eager':
+        return EagerBackend(model)
+    if name == 'int8':
+        return QuantizedBackend(model)
+    if name == 'onnx':
+        return OnnxBackend(model, tokenizer, onnx_path, num_threads)
+    raise ValueError(f'unknown backend {name}; use one of {", ".join(BACKENDS)}')
+
+
+REFERENCE_TEXTS = [
+    'The quick brown fox jumps over the lazy dog.',
+    'SingleStore stores vector embeddings next to relational data.',
+    'El pájaro madrugador atrapa al gusano.',
+    'Der frühe Vogel fängt den Wurm.',
+    'Les actions valent mieux que les mots.',
+    'Fortune favors the bold',
+]
+
+
+def min_cosine_similarity(a, b):
+    """Return the smallest row-wise cosine similarity of two matrices."""
+    a = torch.nn.functional.normalize(torch.as_tensor(a), dim=1)
+    b = torch.nn.functional.normalize(torch.as_tensor(b), dim=1)
+    return (a * b).sum(dim=1).min().item()
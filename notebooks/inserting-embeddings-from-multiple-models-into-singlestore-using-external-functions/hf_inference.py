@@ -0,0 +1,145 @@
+"""
+Hugging Face embedding model of the external function API.
+
+Importing this module pulls in torch and transformers, so the API only
+imports it in the worker processes that serve ``hf_embedding``. The model
+weights and the inference backend are loaded on first use, or ahead of
+time by :func:`warm_up`, and :data:`timings` records how long each step
+took.
+
+"""
+import os
+import tempfile
+import threading
+import time
+
+import torch
+from hf_backends import load_backend
+from hf_backends import min_cosine_similarity
+from hf_backends import REFERENCE_TEXTS
+from transformers import AutoModel
+from transformers import AutoTokenizer
+
+model_name = os.environ.get(
+    'HF_MODEL_NAME',
+    'sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2',
+)
+
+# Number of texts sent through the model in a single forward pass
+hf_batch_size = int(os.environ.get('HF_BATCH_SIZE', '32'))
+
+# Inference backend (eager, int8 or onnx, see hf_backends.py) and the
+# minimum cosine similarity to the fp32 model it must reach at startup
+hf_backend_name = os.environ.get('HF_BACKEND', 'eager')
+hf_accuracy_threshold = float(os.environ.get('HF_ACCURACY_THRESHOLD', '0.99'))
+hf_onnx_path = os.environ.get(
+    'HF_ONNX_PATH',
+    os.path.join(
+        tempfile.gettempdir(), 'hf-onnx', model_name.replace('/', '--') + '.onnx',
+    ),
+)
+
+hf_model = None
+hf_tokenizer = None
+hf_backend = None
+
+# Seconds spent on each startup step of this process
+timings: dict = {}
+_lock = threading.RLock()
+
+
+def load_model():
+    """Load the model weights and tokenizer once."""
+    global hf_model, hf_tokenizer
+    with _lock:
+        if hf_model is None:
+            start = time.perf_counter()
+            hf_tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModel.from_pretrained(model_name)
+            model.eval()
+            hf_model = model
+            timings['weight_load_s'] = time.perf_counter() - start
+    return hf_model, hf_tokenizer
+
+
+def get_hf_embedding(texts, batch_size=None, backend=None):
+    """
+    Embed texts with the Hugging Face model in micro-batches.
+
+    The whole batch is tokenized at once and sorted by token count so that
+    each micro-batch is padded only to the length of its longest member.
+    Token embeddings are mean-pooled using the attention mask and all
+    vectors are normalized together before being returned in input order.
+
+    """
+    if not texts:
+        return []
+
+    backend = backend or get_hf_backend()
+    batch_size = batch_size or hf_batch_size
+    encoded = hf_tokenizer(list(texts), truncation=True)
+    order = sorted(
+        range(len(texts)),
+        key=lambda i: len(encoded['input_ids'][i]),
+    )
+
+    pooled = []
+    with torch.no_grad():
+        for start in range(0, len(order), batch_size):
+            features = [
+                {k: v[i] for k, v in encoded.items()}
+                for i in order[start:start + batch_size]
+            ]
+            inputs = hf_tokenizer.pad(features, return_tensors='pt')
+            hidden = backend(inputs)
+            mask = inputs['attention_mask'].unsqueeze(-1).to(hidden.dtype)
+            summed = (hidden * mask).sum(dim=1)
+            pooled.append(summed / mask.sum(dim=1).clamp(min=1e-9))
+
+        embeddings = torch.nn.functional.normalize(torch.cat(pooled), p=2, dim=1)
+
+        # Undo the length sort
+        inverse = torch.empty(len(order), dtype=torch.long)
+        inverse[torch.tensor(order)] = torch.arange(len(order))
+        return embeddings[inverse].numpy()
+
+
+def get_hf_backend():
+    """Load the configured backend and check it against the fp32 model."""
+    global hf_backend
+    with _lock:
+        if hf_backend is not None:
+            return hf_backend
+
+        model, tokenizer = load_model()
+        start = time.perf_counter()
+        backend = load_backend(
+            hf_backend_name, model, tokenizer, hf_onnx_path,
+            torch.get_num_threads(),
+        )
+        if backend.name != 'eager':
+            reference = get_hf_embedding(REFERENCE_TEXTS, backend=load_backend(
+                'eager', model, tokenizer,
+            ))
+            similarity = min_cosine_similarity(
+                get_hf_embedding(REFERENCE_TEXTS, backend=backend), reference,
+            )
+            if similarity < hf_accuracy_threshold:
+                raise RuntimeError(
+                    f'{backend.name} backend is not accurate enough: cosine '
+                    f'similarity {similarity:.4f} < {hf_accuracy_threshold}',
+                )
+            print(f'{backend.name} backend cosine similarity: {similarity:.4f}')
+        hf_backend = backend
+        timings['backend_load_s'] = time.perf_counter() - start
+        return hf_backend
+
+
+def warm_up():
+    """Load the model and backend and run a first inference."""
+    get_hf_backend()
+    if 'first_inference_s' not in timings:
+        start = time.perf_counter()
+        get_hf_embedding(REFERENCE_TEXTS[:1])
+        timings['first_inference_s'] = time.perf_counter() - start
+    return dict(timings)
@@ -0,0 +1,284 @@
+"""Rate-limited, retrying dispatch of embedding requests to OpenAI."""
+import asyncio
+import base64
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import openai
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+def estimate_tokens(text):
+    """Return the number of tokens in `text` (estimated if tiktoken is missing)."""
+    if tiktoken is not None:
+        return len(_encoding().encode(text, disallowed_special=()))
+    # Rarely fewer than three bytes per token for the OpenAI tokenizers
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+_encodings: list = []
+
+
+def _encoding():
+    if not _encodings:
+        _encodings.append(tiktoken.get_encoding('cl100k_base'))
+    return _encodings[0]
+
+
+def is_retryable(exc):
+    """Rate limits, server errors, timeouts and dropped connections."""
+    if isinstance(exc, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def retry_after(exc):
+    """Return the delay requested by a `Retry-After` header, if any."""
+    response = getattr(exc, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+class RateLimiter:
+    """
+    Token buckets for requests per minute and tokens per minute.
+
+    :meth:`reserve` books capacity immediately and returns how long the
+    caller has to wait before using it, so the same limiter can be shared
+    by threads and coroutines.
+
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.limits = [requests_per_minute, tokens_per_minute]
+        self.levels = [float(x or 0) for x in self.limits]
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            elapsed, self.updated = now - self.updated, now
+            delay = 0.0
+            for i, (limit, amount) in enumerate(zip(self.limits, (1, tokens))):
+                if not limit:
+                    continue
+                rate = limit / 60
+                level = min(limit, self.levels[i] + elapsed * rate) - amount
+                self.levels[i] = level
+                if level < 0:
+                    delay = max(delay, -level / rate)
+            return delay
+
+
+class OpenAIDispatcher:
+    """
+    Send embedding requests to OpenAI in token-budgeted chunks.
+
+    Texts are split into chunks of at most `max_inputs` texts and
+    `max_tokens` estimated tokens. Chunks run concurrently within the
+    requests/tokens per minute limits, and at most `max_concurrency`
+    requests are in flight at once over all threads calling :meth:`embed`
+    (and, separately, over all :meth:`aembed` coroutines). Chunks are
+    retried with jittered exponential backoff on rate limits and server
+    errors. A chunk rejected as a bad request is split in half until the
+    offending rows are isolated, so one bad row cannot fail its neighbours.
+
+    Both :meth:`embed` and :meth:`aembed` return `(vectors, errors)`: two
+    lists in input order holding a float32 vector or an exception per row.
+
+    """
+
+    def __init__(
+        self,
+        client=None,
+        async_client=None,
+        model='text-embedding-ada-002',
+        max_inputs=2048,
+        max_tokens=250000,
+        max_concurrency=4,
+        requests_per_minute=None,
+        tokens_per_minute=None,
+        max_retries=6,
+        base_delay=0.5,
+        max_delay=30.0,
+    ):
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self.max_inputs = max_inputs
+        self.max_tokens = max_tokens
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+        self._executor = None
+        # Bounds the requests of all threads calling `embed`, including
+        # single-chunk batches that run on the caller's thread
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self.counters = dict(requests=0, retries=0, rate_limited=0, failed_rows=0)
+
+    def metrics(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+
+    def chunks(self, texts):
+        """Split positions of `texts` into (positions, token count) chunks."""
+        out = []
+        index, tokens = [], 0
+        for i, text in enumerate(texts):
+            n = estimate_tokens(text)
+            if index and (len(index) >= self.max_inputs or tokens + n > self.max_tokens):
+                out.append((index, tokens))
+                index, tokens = [], 0
+            index.append(i)
+            tokens += n
+        if index:
+            out.append((index, tokens))
+        return out
+
+    def _backoff(self, attempt, exc):
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+        delay = random.uniform(0, delay)  # full jitter
+        return max(delay, retry_after(exc) or 0)
+
+    @staticmethod
+    def _decode(response):
+        return [
+            np.frombuffer(base64.b64decode(item.embedding), dtype='<f4')
+            for item in sorted(response.data, key=lambda x: x.index)
+        ]
+
+    def _request(self, texts, tokens, model):
+        """Embed one chunk, retrying transient errors."""
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self.limiter.reserve(tokens))
+            self._count('requests')
+            try:
+                with self._slots:
+                    response = self.client.embeddings.create(
+                        input=texts, model=model, encoding_format='base64',
+                    )
+                return self._decode(response)
+            except Exception as exc:
+                if not is_retryable(exc) or attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                if isinstance(exc, openai.RateLimitError):
+                    self._count('rate_limited')
+                time.sleep(self._backoff(attempt, exc))
+
+    def _embed_chunk(self, texts, index, tokens, model, vectors, errors):
+        try:
+            embeddings = self._request([texts[i] for i in index], tokens, model)
+            for i, vector in zip(index, embeddings):
+                vectors[i] = vector
+        except openai.BadRequestError as exc:
+            if len(index) == 1:
+                errors[index[0]] = exc
+                self._count('failed_rows')
+                return
+            half = len(index) // 2
+            for part in (index[:half], index[half:]):
+                part_tokens = sum(estimate_tokens(texts[i]) for i in part)
+                self._embed_chunk(texts, part, part_tokens, model, vectors, errors)
+        except Exception as exc:
+            for i in index:
+                errors[i] = exc
+            self._count('failed_rows', len(index))
+
+    def embed(self, texts, model=None):
+        """Embed `texts` and return `(vectors, errors)` in input order."""
+        model = model or self.model
+        vectors = [None] * len(texts)
+        errors = [None] * len(texts)
+        chunks = self.chunks(texts)
+        if len(chunks) == 1:
+            index, tokens = chunks[0]
+            self._embed_chunk(texts, index, tokens, model, vectors, errors)
+            return vectors, errors
+
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix='openai-chunk',
+                )
+        futures = [
+            self._executor.submit(
+                self._embed_chunk, texts, index, tokens, model, vectors, errors,
+            )
+            for index, tokens in chunks
+        ]
+        for future in futures:
+            future.result()
+        return vectors, errors
+
+    async def _arequest(self, texts, tokens, model):
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self.limiter.reserve(tokens))
+            self._count('requests')
+            try:
+                async with self._semaphore:
+                    response = await self.async_client.embeddings.create(
+                        input=texts, model=model, encoding_format='base64',
+                    )
+                return self._decode(response)
+            except Exception as exc:
+                if not is_retryable(exc) or attempt == self.max_retries:
+                    raise
+                self._count('retries')
+                if isinstance(exc, openai.RateLimitError):
+                    self._count('rate_limited')
+                await asyncio.sleep(self._backoff(attempt, exc))
+
+    async def _aembed_chunk(self, texts, index, tokens, model, vectors, errors):
+        try:
+            embeddings = await self._arequest([texts[i] for i in index], tokens, model)
+            for i, vector in zip(index, embeddings):
+                vectors[i] = vector
+        except openai.BadRequestError as exc:
+            if len(index) == 1:
+                errors[index[0]] = exc
+                self._count('failed_rows')
+                return
+            half = len(index) // 2
+            for part in (index[:half], index[half:]):
+                part_tokens = sum(estimate_tokens(texts[i]) for i in part)
+                await self._aembed_chunk(
+                    texts, part, part_tokens, model, vectors, errors,
+                )
+        except Exception as exc:
+            for i in index:
+                errors[i] = exc
+            self._count('failed_rows', len(index))
+
+    async def aembed(self, texts, model=None):
+        """Asynchronous version of :meth:`embed` using `async_client`."""
+        model = model or self.model
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        vectors = [None] * len(texts)
+        errors = [None] * len(texts)
+        await asyncio.gather(*[
+            self._aembed_chunk(texts, index, tokens, model, vectors, errors)
+            for index, tokens in self.chunks(texts)
+        ])
+        return vectors, errors
@@ -0,0 +1,80 @@
+"""
+Encoders for the embedding vectors returned by the external function API.
+
+Two encodings are supported for each vector:
+
+json
+    A JSON array of floats, e.g. ``[0.0123,-0.456,...]``. This is what
+    ``JSON_ARRAY_PACK`` and ``VECTOR`` columns accept. `precision` is the
+    number of significant digits; 9 round-trips float32 values exactly.
+hex
+    The vector packed as little-endian float32 and hex encoded. ``UNHEX`` of
+    this string is byte-for-byte the output of ``JSON_ARRAY_PACK``, so it
+    can be stored in a ``BLOB`` or ``VECTOR`` column without parsing floats.
+
+"""
+import json
+
+import numpy as np
+
+ENCODINGS = ('json', 'hex')
+
+_json_formats: dict = {}
+
+
+def _json_format(dim, precision):
+    """Return a %-format string that renders a whole vector as a JSON array."""
+    fmt = _json_formats.get((dim, precision))
+    if fmt is None:
+        fmt = '[' + ','.join([f'%.{precision}g'] * dim) + ']'
+        _json_formats[(dim, precision)] = fmt
+    return fmt
+
+
+def encode_vectors(vectors, encoding='json', precision=9):
+    """
+    Encode each vector as a string, leaving None entries as None.
+
+    Parameters
+    ----------
+    vectors : Iterable[np.ndarray | list[float] | None]
+        Vectors to encode
+    encoding : str
+        'json' or 'hex'
+    precision : int
+        Significant digits for the 'json' encoding
+
+    Returns
+    -------
+    list[str | None]
+
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f'unknown encoding: {encoding}')
+
+    out = []
+    for vector in vectors:
+        if vector is None:
+            out.append(None)
+            continue
+        vector = np.asarray(vector, dtype='<f4')
+        if encoding == 'hex':
+            out.append(vector.tobytes().hex())
+        else:
+            out.append(_json_format(len(vector), precision) % tuple(vector.tolist()))
+    return out
+
+
+def encode_row(row_id, text):
+    """Render one `[row_id, text]` entry of the response `data` list."""
+    # Encoded vectors contain only digits, signs, dots, commas and brackets,
+    # so they can be quoted as JSON strings without escaping.
+    if text is None:
+        return f'[{json.dumps(row_id)}, null]'
+    return f'[{json.dumps(row_id)}, "{text}"]'
+
+
+def encode_response(row_ids, vectors, encoding='json', precision=9):
+    """Render the whole `{"data": [[row_id, text], ...]}` response body."""
+    rows = map(encode_row, row_ids, encode_vectors(vectors, encoding, precision))
+    return '{"data": [' + ', '.join(rows) + ']}'
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Check that nb-check gives the same result serially and in parallel.
+
+Cell ids must also end up unique across all notebooks, with and without
+the cache.
+
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+NB_CHECK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'nb-check.py')
+
+
+def perturb(paths: List[str]) -> None:
+    """
+    Give the notebooks at `paths` cell ids that nb-check has to fix.
+
+    Every notebook but the first reuses the ids of the first one, whose
+    owner depends on the order notebooks are merged in, and every
+    notebook loses the id of its last cell.
+
+    """
+    first: List[str] = []
+    for i, path in enumerate(paths):
+        with open(path) as infile:
+            nb = json.load(infile)
+        cells = nb['cells']
+        if i == 0:
+            first = [cell['id'] for cell in cells]
+        else:
+            for cell, cell_id in zip(cells, first):
+                cell['id'] = cell_id
+        if cells:
+            cells[-1].pop('id', None)
+        with open(path, 'w') as outfile:
+            json.dump(nb, outfile, indent=2)
+            outfile.write('\n')
+
+
+def snapshot(root: str) -> Dict[str, bytes]:
+    """Return the contents of all files under `root` by relative path."""
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            with open(path, 'rb') as infile:
+                files[os.path.relpath(path, root)] = infile.read()
+    return files
+
+
+def steal_cached_id(paths: List[str]) -> None:
+    """Give the first notebook the id of a cell of the last, left as it is."""
+    with open(paths[-1]) as infile:
+        stolen = json.load(infile)['cells'][0]['id']
+    with open(paths[0]) as infile:
+        nb = json.load(infile)
+    nb['cells'][0]['id'] = stolen
+    with open(paths[0], 'w') as outfile:
+        json.dump(nb, outfile, indent=2)
+        outfile.write('\n')
+
+
+def duplicate_ids(paths: List[str]) -> List[str]:
+    """Return the cell ids used more than once across the notebooks."""
+    counts: Dict[str, int] = {}
+    for path in paths:
+        with open(path) as infile:
+            for cell in json.load(infile)['cells']:
+                counts[cell.get('id')] = counts.get(cell.get('id'), 0) + 1
+    return sorted(str(k) for k, v in counts.items() if v > 1)
+
+
+def run(
+    source: List[str],
+    root: str,
+    jobs: int,
+    cached: bool,
+) -> Tuple[int, str, Dict[str, bytes]]:
+    """
+    Run nb-check with `jobs` over perturbed copies of `source` in `root`.
+
+    If `cached`, a first run fills the cache, and only the first notebook
+    is changed afterwards, to an id that the cached last notebook has.
+
+    """
+    paths = []
+    for directory in source:
+        name = os.path.basename(directory)
+        shutil.copytree(directory, os.path.join(root, 'notebooks', name))
+        paths.append(os.path.join('notebooks', name, 'notebook.ipynb'))
+    full_paths = [os.path.join(root, x) for x in paths]
+    perturb(full_paths)
+    cache = ['--no-cache']
+    if cached:
+        cache = ['--cache', '.nb-check-cache.json']
+        subprocess.run(
+            [sys.executable, NB_CHECK, *cache, *paths],
+            cwd=root, capture_output=True, check=True,
+        )
+        steal_cached_id(full_paths)
+    proc = subprocess.run(
+        [sys.executable, NB_CHECK, *cache, '-j', str(jobs), *paths],
+        cwd=root, capture_output=True, text=True,
+    )
+    shutil.rmtree(os.path.join(root, '.nb-validate-cache'), ignore_errors=True)
+    duplicates = duplicate_ids(full_paths)
+    if duplicates:
+        print(f'-j {jobs}{" cached" if cached else ""}: duplicate ids {duplicates}')
+        sys.exit(1)
+    return proc.returncode, proc.stdout + proc.stderr, snapshot(root)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'notebooks', nargs='*',
+        help='notebook directories to check (default: all in notebooks/)',
+    )
+    parser.add_argument('-j', '--jobs', type=int, default=4)
+    args = parser.parse_args()
+
+    source = args.notebooks or sorted(
+        os.path.dirname(x) for x in glob.glob('notebooks/*/notebook.ipynb')
+        if 'notebook-style-guide' not in x
+    )
+
+    same = True
+    for cached in [False, True]:
+        mode = 'cached' if cached else 'uncached'
+        results = []
+        for jobs in [1, args.jobs]:
+            with tempfile.TemporaryDirectory() as root:
+                results.append(run(source, root, jobs, cached))
+        (serial_status, serial_output, serial_files), (status, output, files) = results
+
+        if (serial_status, serial_output) != (status, output):
+            print(f'{mode} output of -j {args.jobs} differs from -j 1:')
+            print(f'--- -j 1 (exit {serial_status})\n{serial_output}')
+            print(f'--- -j {args.jobs} (exit {status})\n{output}')
+            same = False
+        for path in sorted(serial_files.keys() | files.keys()):
+            if serial_files.get(path) != files.get(path):
+                print(f'{mode}: {path} differs between -j 1 and -j {args.jobs}')
+                same = False
+        print(
+            f'{mode}: -j 1 and -j {args.jobs} give unique ids on {len(source)} '
+            f'notebooks ({len(files)} files, exit {status})',
+        )
+    if not same:
+        sys.exit(1)
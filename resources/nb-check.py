@@ -1,336 +1,454 @@
 #!/usr/bin/env python3
 """Program for validating notebook content."""
-import html
+import argparse
+import concurrent.futures
+import difflib
+import hashlib
+import importlib.metadata
 import json
 import os
-import subprocess
 import sys
+import time
 import tomllib
-import uuid
-import warnings
+from typing import AbstractSet
 from typing import Any
+from typing import Dict
 from typing import List
+from typing import NoReturn
+from typing import Optional
+from typing import Set
+from typing import Tuple
 
-import nbformat
-
-
-DEFAULT_NOTEBOOK_METADATA = {
-    'metadata': {
-        'jupyterlab': {
-            'notebooks': {
-                'version_major': 6,
-                'version_minor': 4,
-            },
-        },
-        'kernelspec': {
-            'display_name': 'Python 3 (ipykernel)',
-            'language': 'python',
-            'name': 'python3',
-        },
-        'language_info': {
-            'codemirror_mode': {
-                'name': 'ipython',
-                'version': 3,
-            },
-            'file_extension': '.py',
-            'mimetype': 'text/x-python',
-            'name': 'python',
-            'nbconvert_exporter': 'python',
-            'pygments_lexer': 'ipython3',
-            'version': '3.11.6',
-        },
-    },
-}
-
-NOTEBOOK_HEADER = [
-    '<div id="singlestore-header" style="display: flex; background-color: {background_color}; padding: 5px;">\n',
-    '    <div id="icon-image" style="width: 90px; height: 90px;">\n',
-    '        <img width="100%" height="100%" src="https://raw.githubusercontent.com/singlestore-labs/spaces-notebooks/master/common/images/header-icons/{icon_name}.png" />\n',
-    '    </div>\n',
-    '    <div id="text" style="padding: 5px; margin-left: 10px;">\n',
-    '        <div id="badge" style="display: inline-block; background-color: rgba(0, 0, 0, 0.15); border-radius: 4px; padding: 4px 8px; align-items: center; margin-top: 6px; margin-bottom: -2px; font-size: 80%">SingleStore Notebooks</div>\n',
-    '        <h1 style="font-weight: 500; margin: 8px 0 0 4px;">{title}</h1>\n',
-    '    </div>\n',
-    '</div>',
-]
-
-NOTEBOOK_STARTER_MESSAGE = [
-    '<div class="alert alert-block alert-warning">\n',
-    '    <b class="fa fa-solid fa-exclamation-circle"></b>\n',
-    '    <div>\n',
-    '        <p><b>Note</b></p>\n',
-    '        <p>This notebook can be run on a Free Starter Workspace. To create a Free Starter Workspace navigate to <tt>Start</tt> using the left nav. You can also use your existing Standard or Premium workspace with this Notebook.</p>\n',
-    '    </div>\n',
-    '</div>',
-]
-
-NOTEBOOK_FOOTER = [
-    '<div id="singlestore-footer" style="background-color: rgba(194, 193, 199, 0.25); height:2px; margin-bottom:10px"></div>\n',
-    '<div><img src="https://raw.githubusercontent.com/singlestore-labs/spaces-notebooks/master/common/images/singlestore-logo-grey.png" style="padding: 0px; margin: 0px; height: 24px"/></div>',
-]
-
-ICON_COLORS = {
-    'arrow-up-right-dots': 'rgba(255, 167, 103, 0.25)',
-    'arrows-spin': 'rgba(124, 195, 235, 0.25)',
-    'binary': 'rgba(210, 255, 153, 0.25)',
-    'block-question': 'rgba(255, 224, 129, 0.25)',
-    'bolt': 'rgba(235, 249, 245, 0.25)',
-    'book-open-cover': 'rgba(124, 195, 235, 0.25)',
-    'browser': 'rgba(235, 249, 245, 0.25)',
-    'calendar-check': 'rgba(235, 249, 245, 0.25)',
-    'camera-movie': 'rgba(255, 182, 176, 0.25)',
-    'chart-network': 'rgba(210, 255, 153, 0.25)',
-    'chart-scatter': 'rgba(124, 195, 235, 0.25)',
-    'clouds': 'rgba(124, 195, 235, 0.25)',
-    'confluent-logo': 'rgba(124, 195, 235, 0.25)',
-    'crystal-ball': 'rgba(255, 167, 103, 0.25)',
-    'database': 'rgba(235, 249, 245, 0.25)',
-    'dollar-circle': 'rgba(255, 167, 103, 0.25)',
-    'face-viewfinder': 'rgba(209, 153, 255, 0.25)',
-    'file-export': 'rgba(255, 182, 176, 0.25)',
-    'files': 'rgba(255, 224, 129, 0.25)',
-    'filter': 'rgba(255, 167, 103, 0.25)',
-    'gears': 'rgba(235, 249, 245, 0.25)',
-    'globe': 'rgba(209, 153, 255, 0.25)',
-    'handshake': 'rgba(255, 224, 129, 0.25)',
-    'id-card': 'rgba(255, 182, 176, 0.25)',
-    'image': 'rgba(255, 224, 129, 0.25)',
-    'laptop': 'rgba(209, 153, 255, 0.25)',
-    'lightbulb-on': 'rgba(255, 167, 103, 0.25)',
-    'link': 'rgba(124, 195, 235, 0.25)',
-    'location-dots': 'rgba(210, 255, 153, 0.25)',
-    'lock': 'rgba(235, 249, 245, 0.25)',
-    'map': 'rgba(255, 224, 129, 0.25)',
-    'megaphone': 'rgba(124, 195, 235, 0.25)',
-    'memo-circle-check': 'rgba(210, 255, 153, 0.25)',
-    'message-dots': 'rgba(210, 255, 153, 0.25)',
-    'nodes-circle': 'rgba(255, 224, 129, 0.25)',
-    'notes': 'rgba(209, 153, 255, 0.25)',
-    'pipeline': 'rgba(255, 167, 103, 0.25)',
-    'radar': 'rgba(255, 182, 176, 0.25)',
-    'rocket': 'rgba(210, 255, 153, 0.25)',
-    'screwdriver-wrench': 'rgba(255, 182, 176, 0.25)',
-    'server': 'rgba(255, 182, 176, 0.25)',
-    'shield': 'rgba(124, 195, 235, 0.25)',
-    'shop': 'rgba(235, 249, 245, 0.25)',
-    'shopping-bag': 'rgba(255, 224, 129, 0.25)',
-    'shopping-cart': 'rgba(255, 167, 103, 0.25)',
-    'star': 'rgba(255, 182, 176, 0.25)',
-    'user-plus': 'rgba(209, 153, 255, 0.25)',
-    'users': 'rgba(210, 255, 153, 0.25)',
-    'vector-circle': 'rgba(209, 153, 255, 0.25)',
-    'waveform': 'rgba(209, 153, 255, 0.25)',
-}
-
-
-IDS = set()
-
-
-def generate_corpus_id():
-    """Generate a corpus id."""
-    while True:
-        id = uuid.uuid4().hex[:8]
-        if id not in IDS:
-            IDS.add(id)
-            return id
-
-
-def error(msg: str) -> None:
-    """Print an error message and end the program."""
-    print('ERROR:', msg, file=sys.stderr)
-    sys.exit(1)
-
-
-def new_markdown_cell(cell_id: str, content: list[str]) -> dict[str, Any]:
+import nbnormalize
+import nbvalidate
+import nbwatch
+from nbnormalize import DEFAULT_RULES
+from nbnormalize import normalize_notebook
+from nbnormalize import NotebookError
+from nbnormalize import OutputBudget
+from nbnormalize import Rule
+
+
+def error(msg: str) -> NoReturn:
+    """Raise an error for the current notebook."""
+    raise NotebookError(msg)
+
+
+def load_meta(toml_path: str) -> Dict[str, Any]:
+    """Load the `meta.toml` of a notebook."""
+    try:
+        with open(toml_path, 'rb') as toml_f:
+            return tomllib.load(toml_f)
+    except Exception:
+        error(f'could not load `meta.toml` file: {toml_path}')
+
+
+class Normalized:
+    """A notebook brought into canonical form, not written back yet."""
+
+    def __init__(
+        self,
+        f: str,
+        original: bytes,
+        text: str,
+        ids: List[str],
+        report: str = '',
+        sidecars: Optional[Dict[str, bytes]] = None,
+    ):
+        self.f = f
+        self.original = original
+        self.text = text
+        self.ids = ids
+        self.report = report
+        self.sidecars = sidecars or {}
+        self.changed = text.encode('utf-8') != original
+
+
+def normalize_file(
+    f: str,
+    reserved: AbstractSet[str] = frozenset(),
+    budget: Optional[Dict[str, Any]] = None,
+    toml_info: Optional[Dict[str, Any]] = None,
+) -> Normalized:
     """
-    Construct a markdown cell for a notebook.
+    Normalize and validate the notebook at path `f` without writing it.
 
     Parameters
     ----------
-    cell_id : str
-        ID to apply
-    content : list[str]
-        The list of strings that make up the cell contents
+    f : str
+        Path to the notebook
+    reserved : AbstractSet[str], optional
+        Cell ids used by other notebooks; cells using them get new ids
+    budget : Dict[str, Any], optional
+        Arguments of an :class:`OutputBudget` rule to apply as well
+    toml_info : Dict[str, Any], optional
+        The contents of the notebook's `meta.toml`, if already loaded
 
     Returns
     -------
-    dict[str, Any]
+    Normalized
+        The original and canonical text of the notebook and its cell ids
 
     """
-    return dict(
-        id=cell_id,
-        cell_type='markdown',
-        metadata={},
-        source=content,
-    )
+    toml_path = os.path.join(os.path.dirname(f), 'meta.toml')
+    if toml_info is None:
+        toml_info = load_meta(toml_path)
 
+    with open(f, 'rb') as infile:
+        original = infile.read()
+    nb = json.loads(original)
 
-for f in sys.argv[1:]:
+    if os.path.basename(f) != 'notebook.ipynb':
+        error(f'notebook must be named `notebook.ipynb`: {f}')
 
-    try:
-        toml_path = os.path.join(os.path.dirname(f), 'meta.toml')
-        with open(toml_path, 'rb') as toml_f:
-            toml_info = tomllib.load(toml_f)
-    except Exception:
-        error(f'could not load `meta.toml` file: {toml_path}')
+    rules: List[Rule] = [x() for x in DEFAULT_RULES]
+    if budget is not None:
+        output_budget = OutputBudget(**budget)
+        rules.append(output_budget)
 
-    with open(f, 'r') as infile:
-        nb = json.loads(infile.read())
+    normalize_notebook(nb, toml_info, f, toml_path, reserved, rules)
 
-    if os.path.basename(f) != 'notebook.ipynb':
-        error(f'notebook must be named `notebook.ipynb`: {f}')
+    nbvalidate.validate(nb)
 
-    # Clear out SingleStore metadata
-    metadata = nb.get('metadata', DEFAULT_NOTEBOOK_METADATA)
-
-    for k in list(metadata.keys()):
-        if k.startswith('singlestore'):
-            del metadata[k]
-
-    # Make sure notebook has a metadata field
-    nb['metadata'] = metadata
-
-    cells = nb.get('cells', [])
-
-    # Remove metadata
-    for i, cell in enumerate(cells):
-        if 'metadata' in cell:
-            cell['metadata'] = {}
-
-    nbversion = nb.get('nbformat', 4)
-    nbversion_minor = max(nb.get('nbformat_minor', 0), 5)
-
-    nb['nbformat'] = nbversion
-    nb['nbformat_minor'] = nbversion_minor
-
-    for i, cell in enumerate(cells):
-        # Remove duplicate IDs
-        if 'id' in cell and cell['id'] in IDS:
-            del cell['id']
-        # Remove invalid IDs
-        if 'id' in cell and len(cell['id']) != 8:
-            del cell['id']
-        # Add ID to cache
-        if 'id' in cell:
-            IDS.add(cell['id'])
-
-    # Generate IDs for cells that need it
-    for i, cell in enumerate(cells):
-        if 'id' not in cell:
-            cell['id'] = generate_corpus_id()
-
-    # Remove empty cells at the end of the notebook
-    end = len(cells) - 1
-    while end > 0 and 'source' in cells[end] and not cells[end]['source']:
-        cells.pop(end)
-        end -= 1
-
-    header_id = generate_corpus_id()
-    footer_id = generate_corpus_id()
-    starter_id = generate_corpus_id()
-
-    # Remove header cell, it will be regenerated later
-    if cells:
-        source = cells[0].get('source', [])
-        if not isinstance(source, str):
-            source = ''.join(source)
-        if 'id="singlestore-header"' in source:
-            header_cell = cells.pop(0)
-            header_id = header_cell.get('id', header_id)
-
-    # Remove Free Starter Workspace notification, it will be regenerated later
-    if cells:
-        remove_cells: List[int] = []
-        for i, cell in enumerate(cells):
-            source = cells[i].get('source', [])
-            if not isinstance(source, str):
-                source = ''.join(source)
-            if 'alert-warning' in source and 'can be run on a Free Starter' in source:
-                remove_cells.insert(0, i)
-        for i in remove_cells:
-            starter_cell = cells.pop(i)
-            starter_id = starter_cell.get('id', starter_id)
-
-    # Remove footer cell, it will be regenerated later
-    if cells:
-        source = cells[-1].get('source', [])
-        if not isinstance(source, str):
-            source = ''.join(source)
-        if 'id="singlestore-footer"' in source:
-            footer_cell = cells.pop(-1)
-            footer_id = footer_cell.get('id', footer_id)
-
-    for cell in cells:
-
-        # Convert source lists to a string
-        source = cell.get('source', [])
-        if isinstance(source, list):
-            source = ''.join(source)
-        source = [x.rstrip() + '\n' for x in source.rstrip().split('\n')]
-        source[-1] = source[-1].rstrip()
-        if source == ['']:
-            source = []
-        cell['source'] = source
-
-        # Remove "attachments": null (not sure how they get in there)
-        if 'attachments' in cell and cell['attachments'] is None:
-            cell['attachments'] = {}
-
-    # Prepare parameter substitutions for header
-    try:
-        icon_name = toml_info['meta']['icon']
-        background_color = ICON_COLORS[icon_name]
-    except KeyError as exc:
-        print(str(exc))
-        error(f'missing or incorrect icon in {toml_path}')
+    text = json.dumps(nb, indent=2) + '\n'
+    ids = [cell['id'] for cell in nb['cells']]
 
-    try:
-        title = html.escape(toml_info['meta']['title'])
-    except KeyError as exc:
-        error(f'missing title in {toml_path}')
+    if budget is None:
+        return Normalized(f, original, text, ids)
+
+    report = ''
+    if output_budget.report:
+        sidecar_bytes = sum(len(x) for x in output_budget.sidecars.values())
+        report = '\n'.join([
+            f'--- {f}: {len(original):,} -> {len(text):,} bytes, '
+            f'{len(original) - len(text):,} saved '
+            f'({sidecar_bytes:,} in {len(output_budget.sidecars)} sidecar files)',
+            *output_budget.report,
+        ]) + '\n'
+    return Normalized(f, original, text, ids, report, output_budget.sidecars)
 
-    try:
-        difficulty = toml_info['meta']['difficulty']
-        if difficulty not in ['beginner', 'intermediate', 'advanced']:
-            error(f'invalid difficulty in {toml_path}')
-    except KeyError as exc:
-        error(f'missing difficulty in {toml_path}')
-
-    # Add header cell
-    header = [
-        x.format(
-            background_color=background_color,
-            icon_name=icon_name,
-            title=title,
-        ) for x in NOTEBOOK_HEADER
-    ]
-    cells.insert(0, new_markdown_cell(header_id, header))
 
-    if toml_info['meta']['minimum_tier'] == 'free-shared':
-        cells.insert(1, new_markdown_cell(starter_id, NOTEBOOK_STARTER_MESSAGE))
+def write_normalized(
+    result: Normalized,
+    write: bool = True,
+) -> Tuple[str, List[str], bool]:
+    """
+    Write a normalized notebook back if it changed and describe the change.
 
-    # Add footer cell
-    cells.append(new_markdown_cell(footer_id, NOTEBOOK_FOOTER))
+    Returns
+    -------
+    Tuple[str, List[str], bool]
+        The output to print, the cell ids of the notebook and whether
+        the notebook was not in canonical form
 
-    # Ensure sequential execution counts
-    code_idx = 1
-    for cell in cells:
-        if cell.get('cell_type', '') == 'code':
-            cell['execution_count'] = code_idx
-            code_idx += 1
+    """
+    f = result.f
+    if not result.changed:
+        return result.report, result.ids, False
 
-            if 'outputs' in cell and len(cell['outputs']) > 0:
-                for output in cell['outputs']:
-                    if 'execution_count' in output:
-                        output['execution_count'] = code_idx
+    if not write:
+        return f'{result.report}would reformat {f}', result.ids, True
 
-    nbformat.validate(nb)
+    for path, content in result.sidecars.items():
+        path = os.path.join(os.path.dirname(f), path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as outfile:
+            outfile.write(content)
 
+    # Only touch files that change so their mtime stays put otherwise
     with open(f, 'w') as outfile:
-        outfile.write(json.dumps(nb, indent=2))
-        outfile.write('\n')
+        outfile.write(result.text)
+
+    diff = difflib.unified_diff(
+        result.original.decode('utf-8').splitlines(keepends=True),
+        result.text.splitlines(keepends=True),
+        fromfile=f'a/{f}',
+        tofile=f'b/{f}',
+    )
+    return result.report + '--- ' + f + ' ---\n' + ''.join(diff), result.ids, True
+
+
+def check_notebook(
+    f: str,
+    reserved: AbstractSet[str] = frozenset(),
+    write: bool = True,
+    budget: Optional[Dict[str, Any]] = None,
+    toml_info: Optional[Dict[str, Any]] = None,
+) -> Tuple[str, List[str], bool]:
+    """
+    Normalize and validate the notebook at path `f`, writing it back.
+
+    See :func:`normalize_file` for the parameters; `write` set to False
+    only reports notebooks that are not in canonical form.
+
+    Returns
+    -------
+    Tuple[str, List[str], bool]
+        The output to print, the cell ids of the notebook and whether
+        the notebook was not in canonical form
+
+    """
+    return write_normalized(normalize_file(f, reserved, budget, toml_info), write)
+
+
+def formatter_version() -> str:
+    """Return a digest of the formatter code, part of every cache key."""
+    digest = hashlib.sha256(importlib.metadata.version('nbformat').encode('utf-8'))
+    for path in [__file__, nbnormalize.__file__, nbvalidate.__file__]:
+        with open(path, 'rb') as infile:
+            digest.update(infile.read())
+    return digest.hexdigest()
+
+
+def cache_key(f: str, version: str) -> Optional[str]:
+    """Return the cache key of the notebook at `f` and its `meta.toml`."""
+    digest = hashlib.sha256(version.encode('utf-8'))
+    try:
+        for path in [f, os.path.join(os.path.dirname(f), 'meta.toml')]:
+            with open(path, 'rb') as infile:
+                digest.update(infile.read())
+                digest.update(b'\0')
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def load_cache(path: str) -> dict[str, Any]:
+    """Load the cache of canonical notebooks, keyed by notebook path."""
+    try:
+        with open(path, 'r') as infile:
+            return json.load(infile)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(path: str, cache: dict[str, Any]) -> None:
+    # Several nb-check processes may run at once; the last one wins
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as outfile:
+        json.dump(cache, outfile, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def watch(
+    files: List[str],
+    cache: Dict[str, Any],
+    cache_path: Optional[str],
+    write: bool = True,
+    budget: Optional[Dict[str, Any]] = None,
+    debounce: float = 0.3,
+    polling: bool = False,
+) -> int:
+    """
+    Check `files`, then check them again whenever they or their `meta.toml` change.
 
-    res = subprocess.run(['git', 'diff', f], capture_output=True, text=True)
-    if res.stdout:
-        print('--- ' + f + ' ---')
-        print(res.stdout)
+    The parsed `meta.toml` files and the cell ids of every notebook are
+    kept between checks, so only the notebooks that changed are read.
+    As in a normal run, a notebook reusing a cell id of an earlier one
+    in `files` gets a new id, and a later notebook reusing one of the ids
+    of a changed notebook is checked again.
+
+    """
+    version = formatter_version()
+    notebooks = {os.path.dirname(os.path.normpath(f)): f for f in files}
+    metas: Dict[str, Dict[str, Any]] = {}
+    ids: Dict[str, List[str]] = {}
+
+    def check(todo: Set[str]) -> None:
+        seen: Set[str] = set()
+        for f in files:
+            entry = cache.get(f, {})
+            if f not in todo:
+                seen.update(ids.get(f, []))
+                continue
+            start = time.perf_counter()
+            key = cache_key(f, version)
+            # Unchanged, e.g. the notebook was just written by this check
+            if key is not None and entry.get('key') == key \
+                    and seen.isdisjoint(entry['ids']):
+                ids[f] = entry['ids']
+                seen.update(ids[f])
+                continue
+            directory = os.path.dirname(os.path.normpath(f))
+            # A notebook being saved may be incomplete; report it and wait
+            # for the next change instead of stopping
+            try:
+                if directory not in metas:
+                    metas[directory] = load_meta(os.path.join(directory, 'meta.toml'))
+                output, new_ids, changed = check_notebook(
+                    f, seen, write, budget, toml_info=metas[directory],
+                )
+            except Exception as exc:
+                print('ERROR:', exc, file=sys.stderr)
+                cache.pop(f, None)
+                continue
+            if output:
+                print(output)
+            print(f'checked {f} in {(time.perf_counter() - start) * 1e3:.1f}ms')
+
+            # Later notebooks using the new ids must get others
+            for later in files[files.index(f) + 1:]:
+                if not set(ids.get(later, [])).isdisjoint(new_ids):
+                    todo.add(later)
+            ids[f] = new_ids
+            seen.update(new_ids)
+            if not changed or write:
+                cache[f] = dict(key=cache_key(f, version), ids=new_ids)
+        if cache_path:
+            save_cache(cache_path, cache)
+
+    check(set(files))
+    paths = [
+        os.path.join(x, y) for x in notebooks for y in ['notebook.ipynb', 'meta.toml']
+    ]
+    watcher = nbwatch.create_watcher(paths, polling=polling)
+    print(f'watching {len(files)} notebooks', file=sys.stderr)
+    try:
+        for changed in nbwatch.changes(watcher, debounce):
+            todo = set()
+            for path in changed:
+                directory = os.path.dirname(path)
+                if os.path.basename(path) == 'meta.toml':
+                    metas.pop(directory, None)
+                todo.add(notebooks[directory])
+            check(todo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('files', nargs='*', metavar='notebook')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=int(os.environ.get('NB_CHECK_JOBS', '1')),
+        help='number of notebooks to normalize in parallel (default: '
+        '$NB_CHECK_JOBS or 1, as pre-commit already runs batches in parallel)',
+    )
+    parser.add_argument(
+        '--check', action='store_true',
+        help='only report notebooks that are not in canonical form',
+    )
+    parser.add_argument(
+        '--cache', default='.nb-check-cache.json',
+        help='file recording notebooks already in canonical form',
+    )
+    parser.add_argument('--no-cache', dest='cache', action='store_const', const=None)
+    parser.add_argument(
+        '--output-budget', type=int, metavar='BYTES',
+        help='report cells whose outputs are larger than this',
+    )
+    parser.add_argument(
+        '--recompress-images', action='store_true',
+        help='recompress images of cells over budget as WebP (needs Pillow)',
+    )
+    parser.add_argument('--image-quality', type=int, default=80, help='WebP quality')
+    parser.add_argument(
+        '--externalize-images', action='store_true',
+        help='move images of cells over budget to files next to the notebook',
+    )
+    parser.add_argument(
+        '--watch', action='store_true',
+        help='keep running and check notebooks again when they or their '
+        '`meta.toml` change',
+    )
+    parser.add_argument(
+        '--poll', action='store_true',
+        help='watch by polling file times instead of using inotify',
+    )
+    parser.add_argument(
+        '--debounce', type=float, default=0.3, metavar='SECONDS',
+        help='wait for changes to settle this long before checking again',
+    )
+    args = parser.parse_args(argv)
+
+    budget = None
+    if args.output_budget is not None:
+        budget = dict(
+            budget=args.output_budget,
+            recompress=args.recompress_images,
+            quality=args.image_quality,
+            externalize=args.externalize_images,
+        )
+        # The budget report is wanted for every notebook
+        args.cache = None
+    elif args.recompress_images or args.externalize_images:
+        parser.error('image options require --output-budget')
+
+    if args.watch:
+        if not args.files:
+            parser.error('--watch needs the notebooks to watch')
+        cache = load_cache(args.cache) if args.cache else {}
+        return watch(
+            args.files, cache, args.cache, not args.check, budget,
+            debounce=args.debounce, polling=args.poll,
+        )
+
+    # Notebooks whose bytes, `meta.toml` and formatter are unchanged since
+    # they were last found canonical are skipped entirely
+    cache = load_cache(args.cache) if args.cache else {}
+    version = formatter_version()
+    keys = [cache_key(f, version) for f in args.files]
+    todo = [
+        f for f, key in zip(args.files, keys)
+        if key is None or cache.get(f, {}).get('key') != key
+    ]
+
+    futures = {}
+    executor = None
+    if args.jobs > 1 and len(todo) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(args.jobs, len(todo)),
+        )
+        for f in todo:
+            futures[f] = executor.submit(normalize_file, f, budget=budget)
+
+    # Cell ids must be unique across all notebooks. Each worker only sees
+    # its own notebook and writes nothing, so results are merged in input
+    # order, and a notebook whose ids meet those of an earlier one is
+    # normalized again from its unchanged file with the ids seen so far
+    # reserved. Notebooks are only written here, which gives the same ids,
+    # files and output as a serial run.
+    seen: Set[str] = set()
+    status = 0
+    try:
+        for f, key in zip(args.files, keys):
+            entry = cache.get(f, {})
+            try:
+                # The key only covers the notebook itself, while its ids must
+                # not meet those of the notebooks before it; a cache hit
+                # whose ids do is normalized again with them reserved
+                if key is not None and entry.get('key') == key \
+                        and seen.isdisjoint(entry['ids']):
+                    output, ids, changed = '', entry['ids'], False
+                else:
+                    if f in futures:
+                        result = futures[f].result()
+                    else:
+                        result = normalize_file(f, seen, budget)
+                    if not seen.isdisjoint(result.ids):
+                        result = normalize_file(f, seen, budget)
+                    output, ids, changed = write_normalized(result, not args.check)
+            except NotebookError as exc:
+                print('ERROR:', exc, file=sys.stderr)
+                return 1
+            seen.update(ids)
+            if output:
+                print(output)
+            if changed and args.check:
+                status = 1
+            elif args.cache:
+                cache[f] = dict(key=cache_key(f, version), ids=ids)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if args.cache:
+            save_cache(args.cache, cache)
+
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""Benchmark notebook normalization on the largest notebooks."""
+import argparse
+import copy
+import glob
+import json
+import os
+import time
+import tomllib
+from typing import Any
+from typing import Callable
+
+import nbformat
+from nbnormalize import normalize_notebook
+
+
+def timed(func: Callable[[], Any], repeat: int) -> float:
+    """Return the best time of `repeat` runs of `func`."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'notebooks', nargs='*',
+        help='notebooks to benchmark (default: the largest in notebooks/)',
+    )
+    parser.add_argument('-n', '--largest', type=int, default=5)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paths = args.notebooks or sorted(
+        glob.glob('notebooks/*/notebook.ipynb'),
+        key=os.path.getsize,
+        reverse=True,
+    )[:args.largest]
+
+    print(
+        f'{"notebook":<50} {"size":>8} {"parse":>8} {"normalize":>10} '
+        f'{"validate":>9} {"dump":>8}',
+    )
+    for path in paths:
+        with open(path, 'rb') as infile:
+            raw = infile.read()
+        with open(os.path.join(os.path.dirname(path), 'meta.toml'), 'rb') as f:
+            meta = tomllib.load(f)
+        nb = json.loads(raw)
+
+        # Normalization works in place, so each run gets a fresh copy
+        copies = [copy.deepcopy(nb) for _ in range(args.repeat)]
+        parse = timed(lambda: json.loads(raw), args.repeat)
+        normalize = timed(
+            lambda: normalize_notebook(copies.pop(), meta, path), args.repeat,
+        )
+        normalize_notebook(nb, meta, path)
+        validate = timed(lambda: nbformat.validate(nb), args.repeat)
+        dump = timed(lambda: json.dumps(nb, indent=2), args.repeat)
+
+        name = os.path.basename(os.path.dirname(path))[:50]
+        print(
+            f'{name:<50} {len(raw) / 1e3:6.0f}KB {parse * 1e3:6.1f}ms '
+            f'{normalize * 1e3:8.2f}ms {validate * 1e3:7.1f}ms {dump * 1e3:6.1f}ms',
+        )
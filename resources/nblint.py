@@ -0,0 +1,628 @@
+"""
+Checks of the metadata files of the repository.
+
+:class:`Index` lists the icons, author images, authors, lessons and
+notebooks of the repository once, and :func:`lint` checks any number of
+notebook ``meta.toml``, ``authors/*.toml`` and ``lessons/*.toml`` files
+against it in one pass. nb-meta-check.py, author-check.py and
+lesson-check.py are thin wrappers around :func:`main`.
+
+repo-lint.py checks the whole repository through :class:`Graph`, the
+cross-references between notebooks, lessons, authors, icons and the
+``[samples] display`` list. The graph is saved in .nb-lint-cache.json,
+so a run only checks what changed and what refers to it, and reports
+unused authors and images. ``repo-lint.py --dependents notebook:NAME``
+lists what would break if that notebook were removed.
+
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import tomllib
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import FrozenSet
+from typing import List
+from typing import NoReturn
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+CARD_ICONS_DIRECTORY = 'common/images/card-header-icons'
+PREVIEW_ICONS_DIRECTORY = 'common/images/preview-header-icons'
+AUTHOR_IMAGES_DIRECTORY = 'common/images/author-images'
+AUTHORS_DIRECTORY = 'authors'
+LESSONS_DIRECTORY = 'lessons'
+NOTEBOOKS_DIRECTORY = 'notebooks'
+SAMPLES_FILE = 'meta.toml'
+GRAPH_CACHE_FILE = '.nb-lint-cache.json'
+
+MINIMUM_TIERS = ['free-shared', 'standard']
+
+# Kinds of files, by the directory they are in
+NOTEBOOK = 'notebook'
+AUTHOR = 'author'
+LESSON = 'lesson'
+
+# Kinds of the other nodes of the cross-reference graph: the root
+# meta.toml with the `[samples] display` list, and images
+SAMPLES = 'samples'
+CARD_ICON = 'card-icon'
+PREVIEW_ICON = 'preview-icon'
+AUTHOR_IMAGE = 'author-image'
+
+# Card and preview icon of notebooks without a lesson area
+DEFAULT_LESSON_ICON = 'notebook.png'
+
+
+class LintError(Exception):
+    """A metadata file breaks a rule."""
+
+
+def error(msg: str) -> NoReturn:
+    raise LintError(msg)
+
+
+def kebab_case(string: str) -> str:
+    # Naive implementation of kebab case to find icon names from lesson areas
+    return re.sub(r'[^a-zA-Z0-9]+', '-', string.strip()).lower()
+
+
+def list_directory(path: str, ext: str = '') -> FrozenSet[str]:
+    """Return the names of the files in `path` with extension `ext`, without it."""
+    if not os.path.isdir(path):
+        return frozenset()
+    return frozenset(
+        x[:len(x) - len(ext)] if ext else x
+        for x in os.listdir(path) if x.endswith(ext)
+    )
+
+
+class Index:
+    """
+    The files the metadata refers to, each listed once as a set.
+
+    Parameters
+    ----------
+    root : str, optional
+        Root directory of the repository
+
+    """
+
+    def __init__(self, root: str = '.'):
+        start = time.perf_counter()
+        self.root = root
+        self.card_icons = list_directory(os.path.join(root, CARD_ICONS_DIRECTORY))
+        self.preview_icons = list_directory(
+            os.path.join(root, PREVIEW_ICONS_DIRECTORY),
+        )
+        self.author_images = list_directory(
+            os.path.join(root, AUTHOR_IMAGES_DIRECTORY), '.png',
+        )
+        self.authors = list_directory(os.path.join(root, AUTHORS_DIRECTORY), '.toml')
+        self.lessons = list_directory(os.path.join(root, LESSONS_DIRECTORY), '.toml')
+        notebooks_directory = os.path.join(root, NOTEBOOKS_DIRECTORY)
+        self.notebook_directories = frozenset(
+            x for x in list_directory(notebooks_directory)
+            if os.path.isdir(os.path.join(notebooks_directory, x))
+        )
+        self.notebooks = frozenset(
+            x for x in list_directory(notebooks_directory)
+            if os.path.isfile(os.path.join(notebooks_directory, x, 'notebook.ipynb'))
+        )
+        self.elapsed = time.perf_counter() - start
+
+    def files(self) -> List[Tuple[str, str]]:
+        """Return the kind and path of every metadata file in the repository."""
+        files = []
+        for name in sorted(self.notebooks):
+            path = os.path.join(self.root, NOTEBOOKS_DIRECTORY, name, 'meta.toml')
+            if os.path.isfile(path):
+                files.append((NOTEBOOK, path))
+        for name in sorted(self.authors):
+            files.append(
+                (AUTHOR, os.path.join(self.root, AUTHORS_DIRECTORY, f'{name}.toml')),
+            )
+        for name in sorted(self.lessons):
+            files.append(
+                (LESSON, os.path.join(self.root, LESSONS_DIRECTORY, f'{name}.toml')),
+            )
+        return files
+
+
+def check_notebook_meta(f: str, info: Dict[str, Any], index: Index) -> None:
+    """Check the meta.toml of a notebook."""
+
+    if 'meta' not in info:
+        error(f'No `meta` section in `{f}`')
+
+    # The meta section requires, title, description, and icon
+    meta = info['meta']
+
+    if 'title' not in meta:
+        error(f'No `title` in `meta` section of {f}')
+
+    if 'description' not in meta:
+        error(f'No `description` in `meta` section of {f}')
+
+    # Authors must be a non-empty list
+    if (
+        'authors' not in meta
+        or not isinstance(meta['authors'], list)
+        or not meta['authors']
+    ):
+        error(f'No `authors` in `meta` section of {f}')
+
+    if 'icon' not in meta:
+        error(f'No `icon` in `meta` section of {f}')
+
+    if 'minimum_tier' not in meta:
+        error(
+            f'No `minimum_tier` in `meta` section of {f}; '
+            f'it must be set to "free-shared" or "standard"',
+        )
+
+    if meta['minimum_tier'] not in MINIMUM_TIERS:
+        error(
+            f'`minimum_tier` in `meta` section of {f} '
+            f'must be set to "free-shared" or "standard"',
+        )
+
+    if 'lesson_areas' not in meta:
+        error(
+            f'No `lesson_areas` in `meta` section of {f}; '
+            f'it must be an array of strings (can be empty)',
+        )
+
+    if not isinstance(meta['lesson_areas'], list):
+        error(
+            f'`lesson_areas` in `meta` section of {f} must be a list',
+        )
+
+    # Tags must be all lower-case, ascii letters
+    tags = meta.get('tags', [])
+
+    if [x.lower() for x in tags] != tags:
+        error(f'Tags must be in all lower-case ({tags}) in {f}')
+
+    if [re.sub(r'[^a-z0-9]', r'', x) for x in tags] != tags:
+        error(f'Tags can only contain letters and numbers ({tags}) in {f}')
+
+    if len(tags) != len(set(tags)):
+        error(f'Duplicate tag found ({tags}) in {f}')
+
+    # Currently only "spaces" is allowed in destinations
+    destinations = meta.get('destinations', [])
+
+    if destinations and [x for x in destinations if x != 'spaces']:
+        error(f'Only "spaces" is allowed in `destinations` in {f}')
+
+    for lesson_area in meta['lesson_areas']:
+        expected_icon_name = f'{kebab_case(lesson_area)}.png'
+        if expected_icon_name not in index.card_icons:
+            error(f'Lesson area {lesson_area} not found in card icons')
+        if expected_icon_name not in index.preview_icons:
+            error(f'Lesson area {lesson_area} not found in preview icons')
+
+    # Authors must have a corresponding author entry
+    for author in meta['authors']:
+        if author not in index.authors:
+            error(f'Author {author} does not have a corresponding author entry in {f}')
+
+
+def check_author(author_path: str, meta: Dict[str, Any], index: Index) -> None:
+    """Check an author file."""
+
+    if 'name' not in meta:
+        error(f'No `name` in `meta` section of {author_path}')
+
+    if 'title' not in meta:
+        error(f'No `title` in `meta` section of {author_path}')
+
+    if 'external' not in meta:
+        error(f'No `external` in `meta` section of {author_path}')
+
+    # Image is optional, but if defined a corresponding image must exist
+    # Image can either be a URL or a filename in common/images/author-images
+    if 'image' in meta:
+        img_reference = meta['image']
+        is_url = bool(re.match(r'^https?://', img_reference))
+
+        if not is_url and img_reference not in index.author_images:
+            img_path = os.path.join(AUTHOR_IMAGES_DIRECTORY, f'{img_reference}.png')
+            error(f'Author image does not exist at {img_path} for {author_path}')
+
+
+def check_lesson(lesson_path: str, meta: Dict[str, Any], index: Index) -> None:
+    """Check a lesson file."""
+
+    if 'notebooks' not in meta.get('meta', {}):
+        error(f'No `notebooks` in `meta` section of {lesson_path}')
+
+    for notebook in meta['meta']['notebooks']:
+        if notebook not in index.notebooks:
+            notebook_path = os.path.join(
+                NOTEBOOKS_DIRECTORY,
+                notebook,
+                'notebook.ipynb',
+            )
+            error(f'notebook file does not exist at {notebook_path}')
+
+
+def check_samples(f: str, info: Dict[str, Any], index: Index) -> None:
+    """Check the `[samples] display` list of the root meta.toml."""
+
+    for name in info.get('samples', {}).get('display', []):
+        if name not in index.notebooks:
+            error(f'Notebook {name} in `[samples] display` of {f} does not exist')
+
+
+CHECKS: Dict[str, Callable[[str, Dict[str, Any], Index], None]] = {
+    NOTEBOOK: check_notebook_meta,
+    AUTHOR: check_author,
+    LESSON: check_lesson,
+    SAMPLES: check_samples,
+}
+
+
+def file_kind(path: str) -> str:
+    """Return the kind of metadata file at `path`, by its directory."""
+    parts = os.path.normpath(path).split(os.sep)
+    if AUTHORS_DIRECTORY in parts[:-1]:
+        return AUTHOR
+    if LESSONS_DIRECTORY in parts[:-1]:
+        return LESSON
+    return NOTEBOOK
+
+
+def lint(
+    files: List[Tuple[str, str]],
+    index: Index,
+    timings: Optional[Dict[str, List[float]]] = None,
+) -> List[str]:
+    """
+    Check metadata files against `index`.
+
+    Parameters
+    ----------
+    files : List[Tuple[str, str]]
+        Kind and path of each file to check
+    index : Index
+        The files of the repository
+    timings : Dict[str, List[float]], optional
+        Seconds spent on each file are appended to this, by kind
+
+    Returns
+    -------
+    List[str]
+        The first error of every file that has one
+
+    """
+    errors = []
+    for kind, path in files:
+        start = time.perf_counter()
+        try:
+            with open(path, 'rb') as infile:
+                CHECKS[kind](path, tomllib.load(infile), index)
+        except LintError as exc:
+            errors.append(str(exc))
+        except tomllib.TOMLDecodeError as exc:
+            errors.append(f'Invalid TOML in {path}: {exc}')
+        if timings is not None:
+            timings.setdefault(kind, []).append(time.perf_counter() - start)
+    return errors
+
+
+def print_timings(index: Index, timings: Dict[str, List[float]]) -> None:
+    print(f'index: {index.elapsed * 1e3:.2f}ms', file=sys.stderr)
+    total = index.elapsed
+    for kind, seconds in timings.items():
+        total += sum(seconds)
+        print(
+            f'{kind}: {len(seconds)} files, {sum(seconds) * 1e3:.2f}ms, '
+            f'{sum(seconds) / len(seconds) * 1e6:.0f}us per file',
+            file=sys.stderr,
+        )
+    print(f'total: {total * 1e3:.2f}ms', file=sys.stderr)
+
+
+def references(kind: str, info: Dict[str, Any]) -> List[str]:
+    """Return the graph nodes that a metadata file of `kind` refers to."""
+
+    def names(section: str, key: str) -> List[str]:
+        # Malformed metadata refers to nothing; its checks report it
+        values = info.get(section, {})
+        values = values.get(key, []) if isinstance(values, dict) else []
+        return [x for x in values if isinstance(x, str)] \
+            if isinstance(values, list) else []
+
+    refs = []
+    if kind == NOTEBOOK:
+        for author in names('meta', 'authors'):
+            refs.append(f'{AUTHOR}:{author}')
+        icons = [f'{kebab_case(x)}.png' for x in names('meta', 'lesson_areas')]
+        for icon in icons or [DEFAULT_LESSON_ICON]:
+            refs.extend([f'{CARD_ICON}:{icon}', f'{PREVIEW_ICON}:{icon}'])
+    elif kind == AUTHOR:
+        image = info.get('image')
+        if isinstance(image, str) and not re.match(r'^https?://', image):
+            refs.append(f'{AUTHOR_IMAGE}:{image}')
+    elif kind == LESSON:
+        for notebook in names('meta', 'notebooks'):
+            refs.append(f'{NOTEBOOK}:{notebook}')
+    elif kind == SAMPLES:
+        for notebook in names('samples', 'display'):
+            refs.append(f'{NOTEBOOK}:{notebook}')
+    return refs
+
+
+def parse(path: str) -> Tuple[Dict[str, Any], Optional[str]]:
+    """Return the contents of a metadata file and the error reading it."""
+    try:
+        with open(path, 'rb') as infile:
+            return tomllib.load(infile), None
+    except OSError:
+        return {}, None
+    except tomllib.TOMLDecodeError as exc:
+        return {}, f'Invalid TOML in {path}: {exc}'
+
+
+def file_digest(*paths: str) -> Optional[str]:
+    """Return a digest of the files at `paths`, or None if one is missing."""
+    digest = hashlib.sha256()
+    try:
+        for path in paths:
+            with open(path, 'rb') as infile:
+                digest.update(infile.read())
+                digest.update(b'\0')
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def lint_version() -> str:
+    """Return a digest of this module, part of the graph cache."""
+    with open(__file__, 'rb') as infile:
+        return hashlib.sha256(infile.read()).hexdigest()
+
+
+class Graph:
+    """
+    Cross-references of the notebooks, lessons, authors and images.
+
+    Every node is named ``KIND:NAME``. A node of a metadata file records
+    a digest of the file, the nodes it refers to, and the first error of
+    its checks. Notebook directories without a notebook.ipynb or
+    meta.toml are kept as nodes with an error, so nothing refers to them.
+    Images are nodes without a file.
+
+    The graph is saved between runs. :meth:`update` only parses the
+    files that changed, and only checks them again along with the nodes
+    that refer to a node that was added, removed or changed.
+
+    """
+
+    def __init__(self, nodes: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.nodes: Dict[str, Dict[str, Any]] = nodes or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'Graph':
+        """Load a saved graph; an empty one if it is missing or outdated."""
+        try:
+            with open(path, 'r') as infile:
+                cache = json.load(infile)
+        except (OSError, ValueError):
+            return cls()
+        if cache.get('version') != lint_version():
+            return cls()
+        return cls(cache['nodes'])
+
+    def save(self, path: str) -> None:
+        with open(path, 'w') as outfile:
+            json.dump(
+                dict(version=lint_version(), nodes=self.nodes),
+                outfile,
+                sort_keys=True,
+            )
+
+    def dependents(self, node: str) -> List[str]:
+        """Return the nodes that refer to `node`, directly or not."""
+        found: Set[str] = set()
+        todo = [node]
+        while todo:
+            target = todo.pop()
+            for k, v in self.nodes.items():
+                if target in v['refs'] and k not in found:
+                    found.add(k)
+                    todo.append(k)
+        return sorted(found)
+
+    def current_nodes(self, index: Index) -> Dict[str, Tuple[str, List[str]]]:
+        """Return the kind and files of every node in the tree."""
+        nodes: Dict[str, Tuple[str, List[str]]] = {}
+        for name in index.notebook_directories:
+            directory = os.path.join(index.root, NOTEBOOKS_DIRECTORY, name)
+            nodes[f'{NOTEBOOK}:{name}'] = (NOTEBOOK, [
+                os.path.join(directory, 'meta.toml'),
+                os.path.join(directory, 'notebook.ipynb'),
+            ])
+        for name in index.authors:
+            nodes[f'{AUTHOR}:{name}'] = (AUTHOR, [
+                os.path.join(index.root, AUTHORS_DIRECTORY, f'{name}.toml'),
+            ])
+        for name in index.lessons:
+            nodes[f'{LESSON}:{name}'] = (LESSON, [
+                os.path.join(index.root, LESSONS_DIRECTORY, f'{name}.toml'),
+            ])
+        samples = os.path.join(index.root, SAMPLES_FILE)
+        if os.path.isfile(samples):
+            nodes[f'{SAMPLES}:{SAMPLES_FILE}'] = (SAMPLES, [samples])
+        for kind, names in [
+            (CARD_ICON, index.card_icons),
+            (PREVIEW_ICON, index.preview_icons),
+            (AUTHOR_IMAGE, index.author_images),
+        ]:
+            for name in names:
+                nodes[f'{kind}:{name}'] = (kind, [])
+        return nodes
+
+    def update(self, index: Index) -> Set[str]:
+        """Bring the graph up to date with the tree; return the checked nodes."""
+
+        current = self.current_nodes(index)
+        changed = set(self.nodes) - set(current)
+        for node in changed:
+            del self.nodes[node]
+
+        # The notebook.ipynb of a notebook is only checked for existence
+        infos: Dict[str, Tuple[Dict[str, Any], Optional[str]]] = {}
+        for node, (kind, paths) in current.items():
+            if not paths:
+                digest = None
+            elif kind == NOTEBOOK:
+                digest = file_digest(paths[0])
+                if digest is not None and os.path.isfile(paths[1]):
+                    digest += '+notebook'
+            else:
+                digest = file_digest(*paths)
+            old = self.nodes.get(node)
+            if old is not None and old['digest'] == digest:
+                continue
+            changed.add(node)
+            infos[node] = parse(paths[0]) if paths else ({}, None)
+            self.nodes[node] = dict(
+                kind=kind,
+                path=paths[0] if paths else None,
+                digest=digest,
+                refs=references(kind, infos[node][0]),
+                error=None,
+            )
+
+        # Check the changed files and everything that refers to a change
+        checked = {
+            k for k, v in self.nodes.items()
+            if v['path'] is not None
+            and (k in changed or changed.intersection(v['refs']))
+        }
+        for node in checked:
+            record = self.nodes[node]
+            info, parse_error = infos.get(node) or parse(record['path'])
+            record['error'] = parse_error or self.check(record, info, index)
+        return checked
+
+    @staticmethod
+    def check(
+        record: Dict[str, Any],
+        info: Dict[str, Any],
+        index: Index,
+    ) -> Optional[str]:
+        """Return the first error of a node, if any."""
+        if record['kind'] == NOTEBOOK and (
+            record['digest'] is None or not record['digest'].endswith('+notebook')
+        ):
+            directory = os.path.dirname(record['path'])
+            return (
+                f'Notebook directory {directory} needs both a notebook.ipynb '
+                f'and a meta.toml'
+            )
+        try:
+            CHECKS[record['kind']](record['path'], info, index)
+        except LintError as exc:
+            return str(exc)
+        return None
+
+    def problems(self) -> Tuple[List[str], List[str]]:
+        """Return the errors of all nodes, and warnings about unused nodes."""
+        errors = sorted(v['error'] for v in self.nodes.values() if v['error'])
+        used = {x for v in self.nodes.values() for x in v['refs']}
+        warnings = [
+            f'{self.nodes[k]["kind"].replace("-", " ").capitalize()} {k.split(":", 1)[1]} '
+            f'is not used'
+            for k in sorted(self.nodes)
+            if k not in used
+            and self.nodes[k]['kind'] in (AUTHOR, CARD_ICON, PREVIEW_ICON, AUTHOR_IMAGE)
+        ]
+        return errors, warnings
+
+
+def main(argv: List[str], kind: Optional[str] = None) -> int:
+    """
+    Check the metadata files given in `argv`, or all of them if none are.
+
+    Files are checked as `kind`, or by the directory they are in. Without
+    files, the saved cross-reference graph is brought up to date, so only
+    what changed since the last run is checked again. Errors are printed
+    to stderr and the exit status is returned.
+
+    """
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('files', nargs='*', help='metadata files to check')
+    parser.add_argument(
+        '--timing',
+        help='print the time spent on the index and per file',
+        default=False,
+        action='store_true',
+    )
+    parser.add_argument(
+        '--dependents',
+        metavar='KIND:NAME',
+        help='list what refers to a node of the cross-reference graph, '
+        'e.g. notebook:NAME, author:NAME or card-icon:FILE.png',
+    )
+    parser.add_argument(
+        '--no-cache',
+        help=f'do not read or write {GRAPH_CACHE_FILE}',
+        default=False,
+        action='store_true',
+    )
+    args = parser.parse_args(argv)
+
+    # Queries are answered from the saved graph, as long as there is one
+    if args.dependents:
+        graph = Graph() if args.no_cache else Graph.load(GRAPH_CACHE_FILE)
+        if not graph.nodes:
+            graph.update(Index())
+            if not args.no_cache:
+                graph.save(GRAPH_CACHE_FILE)
+        if args.dependents not in graph.nodes:
+            print(f'ERROR: No node {args.dependents} in the graph', file=sys.stderr)
+            return 1
+        for node in graph.dependents(args.dependents):
+            print(node)
+        return 0
+
+    index = Index()
+    if args.files:
+        files = [(kind or file_kind(x), x) for x in args.files]
+        timings: Dict[str, List[float]] = {}
+        errors = lint(files, index, timings)
+        for msg in errors:
+            print('ERROR:', msg, file=sys.stderr)
+        if args.timing:
+            print_timings(index, timings)
+        return 1 if errors else 0
+
+    # Only whole-tree runs read the saved graph; checking the files given
+    # (as the pre-commit wrapper does) neither needs nor updates it
+    graph = Graph() if args.no_cache else Graph.load(GRAPH_CACHE_FILE)
+    start = time.perf_counter()
+    checked = graph.update(index)
+    if not args.no_cache:
+        graph.save(GRAPH_CACHE_FILE)
+    errors, warnings = graph.problems()
+    for msg in warnings:
+        print('WARNING:', msg, file=sys.stderr)
+    for msg in errors:
+        print('ERROR:', msg, file=sys.stderr)
+    if args.timing:
+        print(
+            f'index: {index.elapsed * 1e3:.2f}ms, graph: {len(graph.nodes)} nodes, '
+            f'{len(checked)} checked in {(time.perf_counter() - start) * 1e3:.2f}ms',
+            file=sys.stderr,
+        )
+    return 1 if errors else 0
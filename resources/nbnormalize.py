@@ -0,0 +1,545 @@
+"""
+Canonical form of the sample notebooks.
+
+The normalization done by ``nb-check.py`` as a library, so other tools can
+bring a notebook into canonical form without running the script::
+
+    import nbnormalize
+
+    nbnormalize.normalize_notebook(nb, meta, path)
+
+Normalization is a pipeline of :class:`Rule` objects. Every rule gets a
+:meth:`Rule.begin` call for the notebook, a :meth:`Rule.cell` call for
+each cell and a :meth:`Rule.end` call at the end, so the cells are walked
+only once however many rules there are. The joined source of a cell is
+computed once and shared by all rules through :attr:`Cell.text`.
+
+"""
+import base64
+import hashlib
+import html
+import io
+import json
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+
+
+DEFAULT_NOTEBOOK_METADATA = {
+    'metadata': {
+        'jupyterlab': {
+            'notebooks': {
+                'version_major': 6,
+                'version_minor': 4,
+            },
+        },
+        'kernelspec': {
+            'display_name': 'Python 3 (ipykernel)',
+            'language': 'python',
+            'name': 'python3',
+        },
+        'language_info': {
+            'codemirror_mode': {
+                'name': 'ipython',
+                'version': 3,
+            },
+            'file_extension': '.py',
+            'mimetype': 'text/x-python',
+            'name': 'python',
+            'nbconvert_exporter': 'python',
+            'pygments_lexer': 'ipython3',
+            'version': '3.11.6',
+        },
+    },
+}
+
+NOTEBOOK_HEADER = [
+    '<div id="singlestore-header" style="display: flex; background-color: {background_color}; padding: 5px;">\n',
+    '    <div id="icon-image" style="width: 90px; height: 90px;">\n',
+    '        <img width="100%" height="100%" src="https://raw.githubusercontent.com/singlestore-labs/spaces-notebooks/master/common/images/header-icons/{icon_name}.png" />\n',
+    '    </div>\n',
+    '    <div id="text" style="padding: 5px; margin-left: 10px;">\n',
+    '        <div id="badge" style="display: inline-block; background-color: rgba(0, 0, 0, 0.15); border-radius: 4px; padding: 4px 8px; align-items: center; margin-top: 6px; margin-bottom: -2px; font-size: 80%">SingleStore Notebooks</div>\n',
+    '        <h1 style="font-weight: 500; margin: 8px 0 0 4px;">{title}</h1>\n',
+    '    </div>\n',
+    '</div>',
+]
+
+NOTEBOOK_STARTER_MESSAGE = [
+    '<div class="alert alert-block alert-warning">\n',
+    '    <b class="fa fa-solid fa-exclamation-circle"></b>\n',
+    '    <div>\n',
+    '        <p><b>Note</b></p>\n',
+    '        <p>This notebook can be run on a Free Starter Workspace. To create a Free Starter Workspace navigate to <tt>Start</tt> using the left nav. You can also use your existing Standard or Premium workspace with this Notebook.</p>\n',
+    '    </div>\n',
+    '</div>',
+]
+
+NOTEBOOK_FOOTER = [
+    '<div id="singlestore-footer" style="background-color: rgba(194, 193, 199, 0.25); height:2px; margin-bottom:10px"></div>\n',
+    '<div><img src="https://raw.githubusercontent.com/singlestore-labs/spaces-notebooks/master/common/images/singlestore-logo-grey.png" style="padding: 0px; margin: 0px; height: 24px"/></div>',
+]
+
+ICON_COLORS = {
+    'arrow-up-right-dots': 'rgba(255, 167, 103, 0.25)',
+    'arrows-spin': 'rgba(124, 195, 235, 0.25)',
+    'binary': 'rgba(210, 255, 153, 0.25)',
+    'block-question': 'rgba(255, 224, 129, 0.25)',
+    'bolt': 'rgba(235, 249, 245, 0.25)',
+    'book-open-cover': 'rgba(124, 195, 235, 0.25)',
+    'browser': 'rgba(235, 249, 245, 0.25)',
+    'calendar-check': 'rgba(235, 249, 245, 0.25)',
+    'camera-movie': 'rgba(255, 182, 176, 0.25)',
+    'chart-network': 'rgba(210, 255, 153, 0.25)',
+    'chart-scatter': 'rgba(124, 195, 235, 0.25)',
+    'clouds': 'rgba(124, 195, 235, 0.25)',
+    'confluent-logo': 'rgba(124, 195, 235, 0.25)',
+    'crystal-ball': 'rgba(255, 167, 103, 0.25)',
+    'database': 'rgba(235, 249, 245, 0.25)',
+    'dollar-circle': 'rgba(255, 167, 103, 0.25)',
+    'face-viewfinder': 'rgba(209, 153, 255, 0.25)',
+    'file-export': 'rgba(255, 182, 176, 0.25)',
+    'files': 'rgba(255, 224, 129, 0.25)',
+    'filter': 'rgba(255, 167, 103, 0.25)',
+    'gears': 'rgba(235, 249, 245, 0.25)',
+    'globe': 'rgba(209, 153, 255, 0.25)',
+    'handshake': 'rgba(255, 224, 129, 0.25)',
+    'id-card': 'rgba(255, 182, 176, 0.25)',
+    'image': 'rgba(255, 224, 129, 0.25)',
+    'laptop': 'rgba(209, 153, 255, 0.25)',
+    'lightbulb-on': 'rgba(255, 167, 103, 0.25)',
+    'link': 'rgba(124, 195, 235, 0.25)',
+    'location-dots': 'rgba(210, 255, 153, 0.25)',
+    'lock': 'rgba(235, 249, 245, 0.25)',
+    'map': 'rgba(255, 224, 129, 0.25)',
+    'megaphone': 'rgba(124, 195, 235, 0.25)',
+    'memo-circle-check': 'rgba(210, 255, 153, 0.25)',
+    'message-dots': 'rgba(210, 255, 153, 0.25)',
+    'nodes-circle': 'rgba(255, 224, 129, 0.25)',
+    'notes': 'rgba(209, 153, 255, 0.25)',
+    'pipeline': 'rgba(255, 167, 103, 0.25)',
+    'radar': 'rgba(255, 182, 176, 0.25)',
+    'rocket': 'rgba(210, 255, 153, 0.25)',
+    'screwdriver-wrench': 'rgba(255, 182, 176, 0.25)',
+    'server': 'rgba(255, 182, 176, 0.25)',
+    'shield': 'rgba(124, 195, 235, 0.25)',
+    'shop': 'rgba(235, 249, 245, 0.25)',
+    'shopping-bag': 'rgba(255, 224, 129, 0.25)',
+    'shopping-cart': 'rgba(255, 167, 103, 0.25)',
+    'star': 'rgba(255, 182, 176, 0.25)',
+    'user-plus': 'rgba(209, 153, 255, 0.25)',
+    'users': 'rgba(210, 255, 153, 0.25)',
+    'vector-circle': 'rgba(209, 153, 255, 0.25)',
+    'waveform': 'rgba(209, 153, 255, 0.25)',
+}
+
+
+class NotebookError(Exception):
+    """An error in a notebook or its `meta.toml` file."""
+
+
+def generate_corpus_id(path: str, ids: Set[str]) -> str:
+    """
+    Generate a cell id that is not in `ids` and add it.
+
+    Ids are derived from the notebook path and a counter rather than drawn
+    at random, so the same notebook gets the same ids in every run and in
+    any worker process.
+
+    """
+    n = 0
+    while True:
+        id = hashlib.sha1(f'{path}:{n}'.encode('utf-8')).hexdigest()[:8]
+        if id not in ids:
+            ids.add(id)
+            return id
+        n += 1
+
+
+def new_markdown_cell(cell_id: str, content: List[str]) -> Dict[str, Any]:
+    """
+    Construct a markdown cell for a notebook.
+
+    Parameters
+    ----------
+    cell_id : str
+        ID to apply
+    content : list[str]
+        The list of strings that make up the cell contents
+
+    Returns
+    -------
+    dict[str, Any]
+
+    """
+    return dict(
+        id=cell_id,
+        cell_type='markdown',
+        metadata={},
+        source=content,
+    )
+
+
+class Cell:
+    """A cell of the notebook being normalized."""
+
+    def __init__(self, data: Dict[str, Any], index: int):
+        self.data = data
+        self.index = index
+        self.removed = False
+        self._text: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """The source of the cell as a single string."""
+        if self._text is None:
+            source = self.data.get('source', [])
+            self._text = source if isinstance(source, str) else ''.join(source)
+        return self._text
+
+    def set_source(self, source: List[str]) -> None:
+        self.data['source'] = source
+        self._text = ''.join(source)
+
+
+class Context:
+    """The notebook being normalized and the state shared by the rules."""
+
+    def __init__(
+        self,
+        nb: Dict[str, Any],
+        meta: Dict[str, Any],
+        path: str = '',
+        meta_path: str = 'meta.toml',
+        reserved: Iterable[str] = (),
+    ):
+        self.nb = nb
+        self.meta = meta
+        self.path = path
+        self.meta_path = meta_path
+        self.ids = set(reserved)
+        self.cells = [Cell(x, i) for i, x in enumerate(nb.get('cells', []))]
+
+    def kept(self) -> List[Cell]:
+        """Return the cells that have not been removed."""
+        return [x for x in self.cells if not x.removed]
+
+
+class Rule:
+    """A normalization rule; override any of the hooks."""
+
+    def begin(self, ctx: Context) -> None:
+        """Called before the first cell."""
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        """Called for each cell that no earlier rule removed."""
+
+    def end(self, ctx: Context) -> None:
+        """Called after the last cell, in rule order."""
+
+
+class NotebookMetadata(Rule):
+    """Clear out SingleStore metadata and require nbformat 4.5 or later."""
+
+    def begin(self, ctx: Context) -> None:
+        nb = ctx.nb
+        metadata = nb.get('metadata', DEFAULT_NOTEBOOK_METADATA)
+        for k in list(metadata.keys()):
+            if k.startswith('singlestore'):
+                del metadata[k]
+        nb['metadata'] = metadata
+        nb['nbformat'] = nb.get('nbformat', 4)
+        nb['nbformat_minor'] = max(nb.get('nbformat_minor', 0), 5)
+
+
+class CellMetadata(Rule):
+    """Remove cell metadata."""
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        if 'metadata' in cell.data:
+            cell.data['metadata'] = {}
+
+
+class CellIds(Rule):
+    """Drop duplicate and invalid cell ids and generate missing ones."""
+
+    def begin(self, ctx: Context) -> None:
+        self.missing: List[Cell] = []
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        id = cell.data.get('id')
+        if id is not None and (id in ctx.ids or len(id) != 8):
+            del cell.data['id']
+            id = None
+        if id is None:
+            self.missing.append(cell)
+        else:
+            ctx.ids.add(id)
+
+    def end(self, ctx: Context) -> None:
+        # Only now are all ids of the notebook known
+        for cell in self.missing:
+            cell.data['id'] = generate_corpus_id(ctx.path, ctx.ids)
+
+
+class TrailingEmptyCells(Rule):
+    """Remove empty cells at the end of the notebook."""
+
+    def begin(self, ctx: Context) -> None:
+        self.last = 0
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        if 'source' not in cell.data or cell.data['source']:
+            self.last = cell.index
+
+    def end(self, ctx: Context) -> None:
+        for cell in ctx.cells[self.last + 1:]:
+            cell.removed = True
+
+
+class Templates(Rule):
+    """
+    Regenerate the header, Free Starter Workspace note and footer cells.
+
+    Existing copies are removed and new ones built from `meta.toml`,
+    keeping the ids of the removed cells.
+
+    """
+
+    def begin(self, ctx: Context) -> None:
+        self.header: Optional[Cell] = None
+        self.starter: Optional[Cell] = None
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        text = cell.text
+        if cell.index == 0 and 'id="singlestore-header"' in text:
+            self.header = cell
+            cell.removed = True
+        elif 'alert-warning' in text and 'can be run on a Free Starter' in text:
+            self.starter = self.starter or cell
+            cell.removed = True
+
+    def end(self, ctx: Context) -> None:
+        header_id = generate_corpus_id(ctx.path, ctx.ids)
+        footer_id = generate_corpus_id(ctx.path, ctx.ids)
+        starter_id = generate_corpus_id(ctx.path, ctx.ids)
+
+        if self.header is not None:
+            header_id = self.header.data.get('id', header_id)
+        if self.starter is not None:
+            starter_id = self.starter.data.get('id', starter_id)
+
+        kept = ctx.kept()
+        if kept and 'id="singlestore-footer"' in kept[-1].text:
+            kept[-1].removed = True
+            footer_id = kept[-1].data.get('id', footer_id)
+
+        meta = ctx.meta.get('meta', {})
+        icon_name = meta.get('icon')
+        if icon_name not in ICON_COLORS:
+            raise NotebookError(
+                f'missing or incorrect icon {icon_name!r} in {ctx.meta_path}',
+            )
+        if 'title' not in meta:
+            raise NotebookError(f'missing title in {ctx.meta_path}')
+        if 'difficulty' not in meta:
+            raise NotebookError(f'missing difficulty in {ctx.meta_path}')
+        if meta['difficulty'] not in ['beginner', 'intermediate', 'advanced']:
+            raise NotebookError(f'invalid difficulty in {ctx.meta_path}')
+
+        header = [
+            x.format(
+                background_color=ICON_COLORS[icon_name],
+                icon_name=icon_name,
+                title=html.escape(meta['title']),
+            ) for x in NOTEBOOK_HEADER
+        ]
+        cells = [Cell(new_markdown_cell(header_id, header), -1)]
+        if meta.get('minimum_tier') == 'free-shared':
+            cells.append(
+                Cell(new_markdown_cell(starter_id, NOTEBOOK_STARTER_MESSAGE), -1),
+            )
+        ctx.cells[:0] = cells
+        ctx.cells.append(Cell(new_markdown_cell(footer_id, NOTEBOOK_FOOTER), -1))
+
+
+class Source(Rule):
+    """Strip trailing whitespace from source lines and store them as a list."""
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        source = [x.rstrip() + '\n' for x in cell.text.rstrip().split('\n')]
+        source[-1] = source[-1].rstrip()
+        if source == ['']:
+            source = []
+        cell.set_source(source)
+
+        # Remove "attachments": null (not sure how they get in there)
+        if 'attachments' in cell.data and cell.data['attachments'] is None:
+            cell.data['attachments'] = {}
+
+
+class ExecutionCounts(Rule):
+    """Number code cells sequentially."""
+
+    def begin(self, ctx: Context) -> None:
+        self.count = 1
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        if cell.data.get('cell_type', '') != 'code':
+            return
+        cell.data['execution_count'] = self.count
+        self.count += 1
+        for output in cell.data.get('outputs') or []:
+            if 'execution_count' in output:
+                output['execution_count'] = self.count
+
+
+IMAGE_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+}
+
+
+def to_webp(image: bytes, quality: int) -> bytes:
+    """Recompress a PNG or JPEG image as WebP."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise NotebookError('recompressing images requires Pillow')
+    out = io.BytesIO()
+    with Image.open(io.BytesIO(image)) as img:
+        img.save(out, 'WEBP', quality=quality)
+    return out.getvalue()
+
+
+class OutputBudget(Rule):
+    """
+    Measure the outputs of each cell against a size budget.
+
+    Cells whose serialized outputs exceed `budget` bytes are listed in
+    :attr:`report`. The image outputs of those cells can be recompressed
+    as WebP at `quality` (when that makes them smaller) and/or moved to
+    sidecar files in `directory` next to the notebook, which a markdown
+    output then references. The sidecar files are collected in
+    :attr:`sidecars` for the caller to write.
+
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        recompress: bool = False,
+        quality: int = 80,
+        externalize: bool = False,
+        directory: str = 'outputs',
+    ):
+        self.budget = budget
+        self.recompress = recompress
+        self.quality = quality
+        self.externalize = externalize
+        self.directory = directory
+
+    def begin(self, ctx: Context) -> None:
+        self.report: List[str] = []
+        self.sidecars: Dict[str, bytes] = {}
+
+    def cell(self, cell: Cell, ctx: Context) -> None:
+        outputs = cell.data.get('outputs')
+        if not outputs:
+            return
+        size = len(json.dumps(outputs))
+        if size <= self.budget:
+            return
+        self.report.append(
+            f'cell {cell.index}: {size:,} output bytes '
+            f'(budget {self.budget:,})',
+        )
+        for output in outputs:
+            data = output.get('data') or {}
+            for mimetype in [x for x in data if x in IMAGE_EXTENSIONS]:
+                self.shrink(data, mimetype)
+
+    def shrink(self, data: Dict[str, Any], mimetype: str) -> None:
+        encoded = data[mimetype]
+        if isinstance(encoded, list):
+            encoded = ''.join(encoded)
+        image = base64.b64decode(encoded)
+
+        if self.recompress and mimetype != 'image/webp':
+            webp = to_webp(image, self.quality)
+            if len(webp) < len(image):
+                del data[mimetype]
+                mimetype, image = 'image/webp', webp
+                data[mimetype] = base64.b64encode(image).decode('ascii')
+
+        # A markdown output can only reference one image
+        if self.externalize and 'text/markdown' not in data:
+            name = hashlib.sha1(image).hexdigest()[:16]
+            path = f'{self.directory}/{name}.{IMAGE_EXTENSIONS[mimetype]}'
+            self.sidecars[path] = image
+            del data[mimetype]
+            data['text/markdown'] = f'![output]({path})'
+
+
+DEFAULT_RULES = (
+    NotebookMetadata,
+    CellMetadata,
+    CellIds,
+    TrailingEmptyCells,
+    Templates,
+    Source,
+    ExecutionCounts,
+)
+
+
+def normalize_notebook(
+    nb: Dict[str, Any],
+    meta: Dict[str, Any],
+    path: str = '',
+    meta_path: str = 'meta.toml',
+    reserved: Iterable[str] = (),
+    rules: Optional[Iterable[Rule]] = None,
+) -> Dict[str, Any]:
+    """
+    Bring the notebook `nb` into canonical form in place.
+
+    Parameters
+    ----------
+    nb : dict[str, Any]
+        The notebook JSON
+    meta : dict[str, Any]
+        The contents of the notebook's `meta.toml`
+    path : str, optional
+        Path of the notebook, the seed of generated cell ids
+    meta_path : str, optional
+        Path of `meta.toml` used in error messages
+    reserved : Iterable[str], optional
+        Cell ids used by other notebooks; cells using them get new ids
+    rules : Iterable[Rule], optional
+        The rules to apply, instances of :data:`DEFAULT_RULES` by default
+
+    Returns
+    -------
+    dict[str, Any]
+        The notebook `nb`
+
+    """
+    ctx = Context(nb, meta, path, meta_path, reserved)
+    pipeline = list(rules) if rules is not None else [x() for x in DEFAULT_RULES]
+
+    for rule in pipeline:
+        rule.begin(ctx)
+    for cell in list(ctx.cells):
+        for rule in pipeline:
+            if cell.removed:
+                break
+            rule.cell(cell, ctx)
+    for rule in pipeline:
+        rule.end(ctx)
+
+    nb['cells'] = [x.data for x in ctx.kept()]
+    return nb
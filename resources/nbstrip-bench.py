@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""Benchmark output stripping on the largest notebooks."""
+import argparse
+import glob
+import json
+import os
+import time
+import tracemalloc
+import zlib
+from typing import Any
+from typing import Callable
+from typing import Tuple
+
+from nbstrip import STREAM_THRESHOLD
+from nbstrip import stream_stripped
+
+
+def strip_in_memory(content: bytes) -> str:
+    """Reference implementation: decode, strip and re-encode the notebook."""
+    nb = json.loads(content)
+
+    for cell in nb['cells']:
+        if 'metadata' in cell:
+            cell['metadata']['execution'] = {}
+        if 'outputs' in cell:
+            cell['outputs'] = []
+        if 'metadata' in nb:
+            if 'singlestore_connection' in nb['metadata']:
+                nb['metadata']['singlestore_connection'] = {}
+
+    return json.dumps(nb, indent=2)
+
+
+def compress_in_memory(content: bytes) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(strip_in_memory(content).encode('utf-8')) + \
+        compressor.flush()
+
+
+def compress_streaming(content: bytes, threshold: int = 0) -> bytes:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    data = []
+    stream_stripped(
+        content, lambda chunk: data.append(compressor.compress(chunk)),
+        threshold=threshold,
+    )
+    data.append(compressor.flush())
+    return b''.join(data)
+
+
+def compress_default(content: bytes) -> bytes:
+    """Stream only notebooks of at least `STREAM_THRESHOLD` bytes, as nbstrip does."""
+    return compress_streaming(content, STREAM_THRESHOLD)
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Tuple[float, int, Any]:
+    """Return the best time and the peak memory of `func` and its result."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'notebooks', nargs='*',
+        help='notebooks to benchmark (default: the largest in notebooks/)',
+    )
+    parser.add_argument('-n', '--largest', type=int, default=3)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paths = args.notebooks or sorted(
+        glob.glob('notebooks/*/notebook.ipynb'),
+        key=os.path.getsize,
+        reverse=True,
+    )[:args.largest]
+
+    print(
+        f'{"notebook":<50} {"size":>8} {"method":>10} {"time":>8} {"peak":>8}',
+    )
+    for path in paths:
+        with open(path, 'rb') as infile:
+            raw = infile.read()
+        name = os.path.basename(os.path.dirname(path))[:50]
+
+        results = []
+        for method, func in [
+            ('in-memory', compress_in_memory),
+            ('streaming', compress_streaming),
+            ('default', compress_default),
+        ]:
+            seconds, peak, result = measure(lambda: func(raw), args.repeat)
+            results.append(result)
+            print(
+                f'{name:<50} {len(raw) / 1e3:6.0f}KB {method:>10} '
+                f'{seconds * 1e3:6.1f}ms {peak / 1e3:6.0f}KB',
+            )
+
+        # All must produce the same archive entry
+        for result in results[1:]:
+            assert zlib.decompress(result, -15) == zlib.decompress(results[0], -15)
@@ -0,0 +1,288 @@
+"""
+Streaming removal of outputs from notebook JSON.
+
+:func:`stream_stripped` writes the notebook with empty ``outputs`` in the
+same form as ``json.dumps(nb, indent=2)`` of the stripped notebook, but
+without building the notebook in memory. Small cells are decoded one at a
+time; larger ones are walked member by member, and their ``outputs`` are
+skipped without being decoded. The result is passed to `write` in chunks,
+e.g. straight into a compressor. Notebooks below `STREAM_THRESHOLD` bytes
+are decoded whole instead, as ``json`` does that faster in C and the
+memory saved by streaming them does not matter.
+
+As before, the ``execution`` metadata of every cell and the
+``singlestore_connection`` notebook metadata are emptied as well.
+
+"""
+import json
+import re
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import List
+
+STREAM_THRESHOLD = 1 << 20
+
+_WHITESPACE = re.compile(rb'[ \t\n\r]*')
+_SCALAR = re.compile(
+    rb'-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null',
+)
+# Brackets, runs of short strings with few escapes (such as the lines of a
+# text output), or the start of any other string
+_STRUCTURE = re.compile(
+    rb'[\[\]{}]'
+    rb'|(?:"[^"\\]{0,120}(?:\\.[^"\\]{0,120}){0,4}"[ \t\n\r,:]*)+'
+    rb'|"',
+    re.DOTALL,
+)
+
+_decode = json.JSONDecoder().decode
+_raw_decode = json.JSONDecoder().raw_decode
+_encode = json.JSONEncoder(indent=2).encode
+
+# Returned by `_Stripper.small_value` for values that need walking
+_LARGE = object()
+
+
+class _Stripper:
+    """Re-emit notebook JSON in `json.dumps(indent=2)` form, emptying outputs."""
+
+    def __init__(
+        self,
+        content: bytes,
+        write: Callable[[bytes], None],
+        chunk_size: int,
+        window: int = 1 << 13,
+    ):
+        self.content = content
+        self.pos = 0
+        self.write = write
+        self.chunk_size = chunk_size
+        self.window = window
+        self.chunks: List[bytes] = []
+        self.size = 0
+
+    def emit(self, data: bytes) -> None:
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.size >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.chunks:
+            self.write(b''.join(self.chunks))
+            self.chunks = []
+            self.size = 0
+
+    def peek(self) -> int:
+        self.pos = _WHITESPACE.match(self.content, self.pos).end()  # type: ignore
+        if self.pos >= len(self.content):
+            raise ValueError('unexpected end of notebook JSON')
+        return self.content[self.pos]
+
+    def expect(self, char: int) -> None:
+        if self.peek() != char:
+            raise ValueError(f'expected {chr(char)!r} at position {self.pos}')
+        self.pos += 1
+
+    def string(self) -> int:
+        """Move past a string and return its start."""
+        start = self.pos
+        end = start
+        while True:
+            # Long strings (e.g. base64 images) are scanned with bytes.find
+            end = self.content.find(b'"', end + 1)
+            if end < 0:
+                raise ValueError('unterminated string in notebook JSON')
+            backslashes = end - 1
+            while self.content[backslashes] == 0x5c:
+                backslashes -= 1
+            if (end - 1 - backslashes) % 2 == 0:
+                self.pos = end + 1
+                return start
+
+    def skip(self) -> int:
+        """Move past a value without decoding it and return its start."""
+        char = self.peek()
+        if char == 0x22:
+            return self.string()
+        start = self.pos
+        if char not in b'[{':
+            m = _SCALAR.match(self.content, self.pos)
+            if m is None:
+                raise ValueError(f'invalid JSON at position {self.pos}')
+            self.pos = m.end()
+            return start
+        depth = 0
+        while True:
+            m = _STRUCTURE.search(self.content, self.pos)
+            if m is None:
+                raise ValueError('unexpected end of notebook JSON')
+            self.pos = m.end()
+            char = self.content[m.start()]
+            if char == 0x22:
+                if self.pos - m.start() == 1:
+                    self.pos = m.start()
+                    self.string()
+                continue
+            depth += 1 if char in b'[{' else -1
+            if depth == 0:
+                return start
+
+    def decode(self) -> Any:
+        """Decode the next value."""
+        start = self.skip()
+        return _decode(self.content[start:self.pos].decode('utf-8'))
+
+    def small_value(self) -> Any:
+        """
+        Decode the next value if it fits in a window of `window` bytes.
+
+        Most cells do, and decoding them as a whole is cheaper than walking
+        them; `_LARGE` is returned for the others and nothing is consumed.
+
+        """
+        self.peek()
+        window = self.content[self.pos:self.pos + self.window]
+        try:
+            text = window.decode('utf-8')
+        except UnicodeDecodeError as exc:
+            # The window may end in the middle of a character
+            if exc.start < len(window) - 3:
+                raise
+            text = window[:exc.start].decode('utf-8')
+        try:
+            value, end = _raw_decode(text)
+        except json.JSONDecodeError:
+            if len(window) < self.window:
+                raise
+            return _LARGE
+        self.pos += len(text[:end].encode('utf-8'))
+        return value
+
+    def encode(self, value: Any, level: int) -> None:
+        text = _encode(value)
+        if level:
+            text = text.replace('\n', '\n' + '  ' * level)
+        self.emit(text.encode('utf-8'))
+
+    def members(self, level: int) -> Iterator[str]:
+        """Emit the keys of the next object and yield their names."""
+        self.expect(0x7b)
+        indent = b'\n' + b'  ' * (level + 1)
+        n = 0
+        while self.peek() != 0x7d:
+            if n:
+                self.expect(0x2c)
+                self.peek()
+            name = _decode(self.content[self.string():self.pos].decode('utf-8'))
+            self.expect(0x3a)
+            self.emit(
+                (b',' if n else b'{') + indent + _encode(name).encode('utf-8')
+                + b': ',
+            )
+            yield name
+            n += 1
+        self.pos += 1
+        self.emit(b'\n' + b'  ' * level + b'}' if n else b'{}')
+
+    def notebook(self) -> None:
+        if self.peek() != 0x7b:
+            self.encode(self.decode(), 0)
+            return
+        for name in self.members(0):
+            if name == 'cells' and self.peek() == 0x5b:
+                self.cells(1)
+                continue
+            value = self.decode()
+            if name == 'metadata' and isinstance(value, dict):
+                if 'singlestore_connection' in value:
+                    value['singlestore_connection'] = {}
+            self.encode(value, 1)
+
+    def cells(self, level: int) -> None:
+        self.expect(0x5b)
+        indent = b'\n' + b'  ' * (level + 1)
+        n = 0
+        while self.peek() != 0x5d:
+            if n:
+                self.expect(0x2c)
+            self.emit((b',' if n else b'[') + indent)
+            cell = self.small_value()
+            if cell is _LARGE:
+                self.cell(level + 1)
+            else:
+                if isinstance(cell, dict):
+                    if 'metadata' in cell:
+                        cell['metadata']['execution'] = {}
+                    if 'outputs' in cell:
+                        cell['outputs'] = []
+                self.encode(cell, level + 1)
+            n += 1
+        self.pos += 1
+        self.emit(b'\n' + b'  ' * level + b']' if n else b'[]')
+
+    def cell(self, level: int) -> None:
+        if self.peek() != 0x7b:
+            self.encode(self.decode(), level)
+            return
+        for name in self.members(level):
+            if name == 'outputs':
+                self.skip()
+                self.emit(b'[]')
+                continue
+            value = self.decode()
+            if name == 'metadata':
+                value['execution'] = {}
+            self.encode(value, level + 1)
+
+
+def strip_decoded(content: bytes) -> str:
+    """Remove outputs from the notebook JSON in `content`, decoding it whole."""
+    nb = json.loads(content)
+    if isinstance(nb, dict):
+        metadata = nb.get('metadata')
+        if isinstance(metadata, dict) and 'singlestore_connection' in metadata:
+            metadata['singlestore_connection'] = {}
+        cells = nb.get('cells')
+        for cell in cells if isinstance(cells, list) else []:
+            if isinstance(cell, dict):
+                if 'metadata' in cell:
+                    cell['metadata']['execution'] = {}
+                if 'outputs' in cell:
+                    cell['outputs'] = []
+    return _encode(nb)
+
+
+def stream_stripped(
+    content: bytes,
+    write: Callable[[bytes], None],
+    chunk_size: int = 1 << 16,
+    threshold: int = STREAM_THRESHOLD,
+) -> None:
+    """
+    Write the notebook JSON in `content` with its outputs removed.
+
+    The UTF-8 encoded output is passed to `write` in chunks of about
+    `chunk_size` bytes and is identical to ``json.dumps(nb, indent=2)`` of
+    the stripped notebook. Notebooks smaller than `threshold` bytes are
+    decoded whole rather than streamed.
+
+    """
+    if len(content) < threshold:
+        data = strip_decoded(content).encode('utf-8')
+        for start in range(0, len(data), chunk_size):
+            write(data[start:start + chunk_size])
+        return
+    stripper = _Stripper(content, write, chunk_size)
+    stripper.notebook()
+    if _WHITESPACE.match(content, stripper.pos).end() != len(content):  # type: ignore
+        raise ValueError('extra data after notebook JSON')
+    stripper.flush()
+
+
+def strip_notebook(content: bytes) -> str:
+    """Remove outputs from the notebook JSON in `content`."""
+    chunks: List[bytes] = []
+    stream_stripped(content, chunks.append)
+    return b''.join(chunks).decode('utf-8')
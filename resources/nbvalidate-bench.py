@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Benchmark notebook validation over the whole notebooks/ corpus."""
+import argparse
+import copy
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+from typing import Callable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+import nbformat
+import nbvalidate
+
+# Startup of a fresh process: imports plus a validator ready to use
+STARTUP = {
+    'nbformat': (
+        'import nbformat.validator; nbformat.validator.get_validator(4, 5)'
+    ),
+    'compiled': (
+        'import sys; sys.path.insert(0, {resources!r}); import nbvalidate; '
+        'nbvalidate.get_validators({cache!r})'
+    ),
+}
+
+
+def startup(statement: str, repeat: int) -> float:
+    """Return the best time of `statement` in a new interpreter, less its startup."""
+    def run(code: str) -> float:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        return time.perf_counter() - start
+    base = min(run('pass') for _ in range(repeat))
+    return min(run(statement) for _ in range(repeat)) - base
+
+
+def timed(func: Callable[[], Any], repeat: int) -> float:
+    """Return the best time of `repeat` runs of `func`."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def error_of(func: Callable[[Any], None], nb: Any) -> Optional[str]:
+    try:
+        func(copy.deepcopy(nb))
+    except nbformat.ValidationError as exc:
+        return str(exc)
+    return None
+
+
+def broken_copies(nb: Any) -> List[Any]:
+    """Return copies of `nb` with a few kinds of schema errors."""
+    copies = []
+    if nb['cells']:
+        for key, value in [('source', 1), ('cell_type', 'unknown'), ('extra', 1)]:
+            broken = copy.deepcopy(nb)
+            broken['cells'][0][key] = value
+            copies.append(broken)
+    for i, cell in enumerate(nb['cells']):
+        if cell.get('outputs'):
+            broken = copy.deepcopy(nb)
+            broken['cells'][i]['outputs'][0]['output_type'] = 'unknown'
+            copies.append(broken)
+            break
+    return copies
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        'notebooks', nargs='*',
+        help='notebooks to benchmark (default: all in notebooks/)',
+    )
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    paths = args.notebooks or sorted(glob.glob('notebooks/*/notebook.ipynb'))
+    notebooks = []
+    for path in paths:
+        with open(path, 'rb') as infile:
+            notebooks.append(json.load(infile))
+    size = sum(os.path.getsize(x) for x in paths)
+
+    cache = tempfile.mkdtemp()
+    try:
+        resources = os.path.dirname(os.path.abspath(__file__))
+        compiled = STARTUP['compiled'].format(resources=resources, cache=cache)
+        cold = startup(f'import shutil; shutil.rmtree({cache!r}, True); {compiled}', 1)
+        print(f'{"startup":<10} {"nbformat":>10} {"cold":>10} {"cached":>10}')
+        print(
+            f'{"":<10} {startup(STARTUP["nbformat"], args.repeat) * 1e3:8.1f}ms '
+            f'{cold * 1e3:8.1f}ms {startup(compiled, args.repeat) * 1e3:8.1f}ms',
+        )
+
+        nbvalidate.get_validators(cache)
+        print(f'\n{len(paths)} notebooks, {size / 1e6:.1f}MB')
+        print(f'{"method":<10} {"time":>10} {"per notebook":>14}')
+        methods: List[Tuple[str, Callable[[Any], None]]] = [
+            ('nbformat', nbformat.validate),
+            ('compiled', nbvalidate.validate),
+        ]
+        for method, func in methods:
+            seconds = timed(lambda: [func(nb) for nb in notebooks], args.repeat)
+            print(
+                f'{method:<10} {seconds * 1e3:8.1f}ms '
+                f'{seconds / len(notebooks) * 1e3:12.2f}ms',
+            )
+
+        # Both must give the same verdict and error on every notebook
+        cases = 0
+        for nb in notebooks:
+            for case in [nb, *broken_copies(nb)]:
+                expected = error_of(nbformat.validate, case)
+                assert error_of(nbvalidate.validate, case) == expected
+                assert nbvalidate.is_valid(copy.deepcopy(case)) == (expected is None)
+                cases += 1
+        print(f'\nsame errors as nbformat.validate in {cases} cases')
+    finally:
+        shutil.rmtree(cache, ignore_errors=True)
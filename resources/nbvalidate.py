@@ -0,0 +1,203 @@
+"""
+Notebook schema validation with validators compiled once and kept on disk.
+
+``nbformat.validate`` imports nbformat, compiles the whole v4.5 schema in
+every process and checks each cell against every cell type. Here the
+schema is split into the notebook itself and one validator per cell type,
+each compiled to Python code by fastjsonschema and saved in a cache
+directory, where Python keeps its bytecode as for any module. Cells are
+checked against the schema of their own ``cell_type`` only, and output
+data is only checked to be a string or a list of strings, without
+walking the (often base64) payloads.
+
+Notebooks that fail, or that the fast path does not cover (other format
+versions, unknown cell types, missing or duplicate cell ids), are handed
+to ``nbformat.validate``, so the errors are exactly those of nbformat.
+
+"""
+import copy
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import marshal
+import os
+import re
+import sys
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Optional
+
+NBFORMAT = 4
+NBFORMAT_MINOR = 5
+CACHE_DIRECTORY = '.nb-validate-cache'
+CELL_TYPES = ('code', 'markdown', 'raw')
+
+# Mime types of output data that may hold any JSON value
+_JSON_MIMETYPE = re.compile(r'^application/(.*\+)?json$')
+
+_validators: Dict[str, Callable[[Any], Any]] = {}
+
+
+def schema_path() -> str:
+    """Return the path of the nbformat v4.5 schema, without importing nbformat."""
+    spec = importlib.util.find_spec('nbformat')
+    if spec is None or spec.origin is None:
+        raise ImportError('nbformat is not installed')
+    return os.path.join(
+        os.path.dirname(spec.origin),
+        f'v{NBFORMAT}',
+        f'nbformat.v{NBFORMAT}.{NBFORMAT_MINOR}.schema.json',
+    )
+
+
+def split_schema(schema: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Split the notebook schema into the parts that are compiled.
+
+    Parameters
+    ----------
+    schema : Dict[str, Any]
+        The nbformat v4.5 schema
+
+    Returns
+    -------
+    Dict[str, Dict[str, Any]]
+        Schemas of the notebook without its cells, and of each cell type
+
+    """
+    schema = copy.deepcopy(schema)
+    definitions = schema['definitions']
+
+    # Output data is checked by `check_mimebundle` instead
+    for output_type in ['execute_result', 'display_data']:
+        definitions[output_type]['properties']['data'] = {'type': 'object'}
+
+    notebook = copy.deepcopy(schema)
+    notebook['properties']['cells'] = {'type': 'array'}
+    parts = {'notebook': notebook}
+    for cell_type in CELL_TYPES:
+        parts[f'{cell_type}_cell'] = {
+            '$schema': schema['$schema'],
+            'definitions': definitions,
+            '$ref': f'#/definitions/{cell_type}_cell',
+        }
+    return parts
+
+
+def compile_validators(cache_directory: str) -> Dict[str, Callable[[Any], Any]]:
+    """
+    Load the compiled validators, generating their code if it is missing.
+
+    The generated code and its bytecode are kept in a directory named by
+    a digest of the schema, the fastjsonschema version and the Python
+    version, so changing any of them compiles the validators again.
+
+    """
+    with open(schema_path(), 'rb') as infile:
+        raw = infile.read()
+    digest = hashlib.sha256(raw)
+    digest.update(importlib.metadata.version('fastjsonschema').encode('utf-8'))
+    digest.update(split_schema.__code__.co_code)
+    digest.update(sys.implementation.cache_tag.encode('utf-8'))
+    directory = os.path.join(cache_directory, digest.hexdigest()[:16])
+
+    parts = None
+    validators = {}
+    for name in ['notebook', *(f'{x}_cell' for x in CELL_TYPES)]:
+        path = os.path.join(directory, f'{name}.py')
+        try:
+            with open(f'{path}.marshal', 'rb') as infile:
+                code = marshal.load(infile)
+        except (OSError, EOFError, ValueError, TypeError):
+            if parts is None:
+                import fastjsonschema
+                parts = split_schema(json.loads(raw))
+                os.makedirs(directory, exist_ok=True)
+            source = fastjsonschema.compile_to_code(parts[name])
+            code = compile(source, path, 'exec')
+            write_atomic(path, source.encode('utf-8'))
+            write_atomic(f'{path}.marshal', marshal.dumps(code))
+        namespace: Dict[str, Any] = {'__name__': f'_nbvalidate_{name}'}
+        exec(code, namespace)
+        validators[name] = namespace['validate']
+    return validators
+
+
+def write_atomic(path: str, content: bytes) -> None:
+    # Several nb-check processes may compile at once; the last one wins
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as outfile:
+        outfile.write(content)
+    os.replace(tmp_path, path)
+
+
+def get_validators(
+    cache_directory: Optional[str] = None,
+) -> Dict[str, Callable[[Any], Any]]:
+    """Return the validators, loading them once per process."""
+    if not _validators:
+        _validators.update(compile_validators(cache_directory or CACHE_DIRECTORY))
+    return _validators
+
+
+def check_mimebundle(data: Any) -> bool:
+    """Return whether output data matches ``misc/mimebundle`` of the schema."""
+    if not isinstance(data, dict):
+        return False
+    for mimetype, value in data.items():
+        if isinstance(value, str) or _JSON_MIMETYPE.match(mimetype):
+            continue
+        if not isinstance(value, list) or not all(isinstance(x, str) for x in value):
+            return False
+    return True
+
+
+def is_valid(nb: Any, cache_directory: Optional[str] = None) -> bool:
+    """
+    Return whether the fast path finds `nb` valid.
+
+    False means the notebook is invalid or is not covered by the fast
+    path; ``nbformat.validate`` decides which.
+
+    """
+    if not isinstance(nb, dict) or 'cells' not in nb:
+        return False
+    if nb.get('nbformat') != NBFORMAT or nb.get('nbformat_minor') != NBFORMAT_MINOR:
+        return False
+    cells = nb['cells']
+    if not isinstance(cells, list):
+        return False
+
+    validators = get_validators(cache_directory)
+    ids = set()
+    try:
+        validators['notebook'](nb)
+        for cell in cells:
+            if not isinstance(cell, dict) or cell.get('cell_type') not in CELL_TYPES:
+                return False
+            validators[f'{cell["cell_type"]}_cell'](cell)
+            if cell['id'] in ids:
+                return False
+            ids.add(cell['id'])
+            for output in cell.get('outputs', []):
+                if 'data' in output and not check_mimebundle(output['data']):
+                    return False
+    except Exception:
+        return False
+    return True
+
+
+def validate(nb: Any, cache_directory: Optional[str] = None) -> None:
+    """
+    Validate a notebook against the nbformat schema.
+
+    Raises the same ``nbformat.ValidationError`` as ``nbformat.validate``,
+    which is only imported for notebooks the fast path does not accept.
+
+    """
+    if is_valid(nb, cache_directory):
+        return
+    import nbformat
+    nbformat.validate(nb)
@@ -0,0 +1,183 @@
+"""
+Waiting for changes to a set of files.
+
+:class:`InotifyWatcher` uses the Linux inotify API through ctypes, so it
+needs no extra packages; it watches the directories of the files, which
+also catches editors (and Jupyter) saving through a temporary file that
+is renamed over the original. :class:`PollingWatcher` compares the size
+and modification time of the files instead, and works everywhere.
+:func:`changes` groups bursts of changes, such as repeated autosaves,
+into one.
+
+"""
+import abc
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import time
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Set
+from typing import Tuple
+
+# inotify events of a file being written, moved into place or removed
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# struct inotify_event: wd, mask, cookie and length of the name that follows
+_EVENT = struct.Struct('iIII')
+
+
+class Watcher(abc.ABC):
+    """
+    Wait for changes to `paths`.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Files to watch; changes to other files are ignored
+
+    """
+
+    def __init__(self, paths: Iterable[str]):
+        self.paths = {os.path.normpath(x) for x in paths}
+
+    @abc.abstractmethod
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        """Return the paths that changed, waiting at most `timeout` seconds."""
+
+    def close(self) -> None:
+        """Release the resources of the watcher."""
+
+
+class InotifyWatcher(Watcher):
+    """Wait for changes with inotify; raises OSError where it is not available."""
+
+    def __init__(self, paths: Iterable[str]):
+        super().__init__(paths)
+        if not sys.platform.startswith('linux'):
+            raise OSError('inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.directories: Dict[int, str] = {}
+        for directory in sorted({os.path.dirname(x) for x in self.paths}):
+            wd = libc.inotify_add_watch(
+                self.fd, os.fsencode(directory or '.'), WATCH_MASK,
+            )
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, os.strerror(errno), directory)
+            self.directories[wd] = directory
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        data = os.read(self.fd, 1 << 16)
+        changed = set()
+        pos = 0
+        while pos < len(data):
+            wd, _, _, length = _EVENT.unpack_from(data, pos)
+            pos += _EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            path = os.path.join(self.directories.get(wd, ''), name)
+            if path in self.paths:
+                changed.add(path)
+        return changed
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """
+    Wait for changes by checking the files every `interval` seconds.
+
+    Parameters
+    ----------
+    paths : Iterable[str]
+        Files to watch
+    interval : float, optional
+        Seconds between checks
+
+    """
+
+    def __init__(self, paths: Iterable[str], interval: float = 0.5):
+        super().__init__(paths)
+        self.interval = interval
+        self.stats = {x: self.stat(x) for x in self.paths}
+
+    @staticmethod
+    def stat(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def wait(self, timeout: Optional[float] = None) -> Set[str]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path in self.paths:
+                stat = self.stat(path)
+                if stat != self.stats[path]:
+                    self.stats[path] = stat
+                    changed.add(path)
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return changed
+            time.sleep(min(self.interval, remaining))
+
+
+def create_watcher(
+    paths: Iterable[str],
+    polling: bool = False,
+    interval: float = 0.5,
+) -> Watcher:
+    """Return an inotify watcher of `paths`, or a polling one if it fails."""
+    paths = list(paths)
+    if not polling:
+        try:
+            return InotifyWatcher(paths)
+        except (OSError, AttributeError) as exc:
+            print(f'inotify is not available ({exc}); polling', file=sys.stderr)
+    return PollingWatcher(paths, interval)
+
+
+def changes(watcher: Watcher, debounce: float = 0.3) -> Iterator[Set[str]]:
+    """
+    Yield the paths that changed, once no change came for `debounce` seconds.
+
+    A burst of changes, such as an editor saving a file several times in a
+    row, is yielded as one set.
+
+    """
+    while True:
+        pending = watcher.wait()
+        if not pending:
+            continue
+        while True:
+            more = watcher.wait(debounce)
+            if not more:
+                break
+            pending |= more
+        yield pending
@@ -1,34 +1,278 @@
 #!/usr/bin/env python3
 """Package sample notebooks for use in the managed service portal."""
 import argparse
+import collections
+import copy
+import hashlib
 import json
 import os
 import sys
+import struct
+import time
 import tomllib
+import zlib
+from concurrent.futures import Future
+from concurrent.futures import ProcessPoolExecutor
+from stat import S_IFREG
+from typing import Any
+from typing import Deque
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import Tuple
+from typing import Union
+from zipfile import BadZipFile
+from zipfile import LargeZipFile
+from zipfile import ZIP_DEFLATED
+from zipfile import ZIP_STORED
 from zipfile import ZipFile
+from zipfile import ZipInfo
+
+import nbstrip
+from nbstrip import stream_stripped
+from nbstrip import strip_notebook
 
 
 NOTEBOOK_FILE_NAME = 'notebook.ipynb'
 
 REQUIRED_FILES = [NOTEBOOK_FILE_NAME, 'meta.toml']
 
+# Directories of a notebook with tooling for its maintainers, such as
+# benchmarks and load tests, which are not packaged
+EXCLUDED_DIRECTORIES = ['bench']
+
+# Name of the catalog index in the archives
+CATALOG_FILE_NAME = 'catalog.json'
+
+# Notebook metadata fields the catalog has an inverted index of
+CATALOG_INDEX_FIELDS = [
+    'tags', 'lesson_areas', 'authors', 'difficulty', 'minimum_tier', 'destinations',
+]
+
+# Deflate level per file extension ('' for all others); 0 stores the file.
+# Images and PDFs are already compressed and only get bigger when deflated.
+DEFAULT_COMPRESSION = {
+    '': 6,
+    '.gif': 0,
+    '.gz': 0,
+    '.jpeg': 0,
+    '.jpg': 0,
+    '.pdf': 0,
+    '.png': 0,
+    '.webp': 0,
+    '.zip': 0,
+}
+
+# Deflate settings; all of them affect the compressed bytes
+DEFLATE_MEM_LEVEL = 8
+DEFLATE_STRATEGY = zlib.Z_DEFAULT_STRATEGY
+
+# Timestamp and permissions of the entries of reproducible archives.
+# The timestamp is the earliest a zip file can hold, or SOURCE_DATE_EPOCH.
+REPRODUCIBLE_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+REPRODUCIBLE_MODE = S_IFREG | 0o644
+
+# Sizes and offsets above this need ZIP64 extensions
+ZIP64_LIMIT = (1 << 31) - 1
+
+# Flag of entries whose file name is encoded as UTF-8
+ZIP_UTF8_FLAG = 0x800
+
+# CRC, uncompressed size, compression method, compressed data and the
+# sha256 digest of the uncompressed data
+CompressedEntry = Tuple[int, int, int, bytes, str]
+
 
 def strip_outputs(path: str) -> str:
     """Remove outputs from notebook at path."""
 
-    with open(path, 'r') as infile:
-        nb = json.loads(infile.read())
+    with open(path, 'rb') as infile:
+        return strip_notebook(infile.read())
+
 
-        for cell in nb['cells']:
-            if 'metadata' in cell:
-                cell['metadata']['execution'] = {}
-            if 'outputs' in cell:
-                cell['outputs'] = []
-            if 'metadata' in nb:
-                if 'singlestore_connection' in nb['metadata']:
-                    nb['metadata']['singlestore_connection'] = {}
+def new_compressor(level: int) -> Any:
+    """Return a raw deflate compressor for a zip entry."""
+    return zlib.compressobj(
+        level, zlib.DEFLATED, -15, DEFLATE_MEM_LEVEL, DEFLATE_STRATEGY,
+    )
 
-        return json.dumps(nb, indent=2)
+
+def compress(content: bytes, level: int) -> CompressedEntry:
+    """Compress `content` for a zip entry, storing it if that is smaller."""
+
+    crc = zlib.crc32(content)
+    digest = hashlib.sha256(content).hexdigest()
+    if level:
+        compressor = new_compressor(level)
+        data = compressor.compress(content) + compressor.flush()
+        if len(data) < len(content):
+            return crc, len(content), ZIP_DEFLATED, data, digest
+    return crc, len(content), ZIP_STORED, content, digest
+
+
+def strip_and_compress(content: bytes, level: int) -> CompressedEntry:
+    """
+    Strip the outputs of a notebook and compress it for a zip entry.
+
+    The stripped notebook is streamed into the compressor in chunks, so
+    for large notebooks neither the decoded notebook nor the whole
+    stripped text are held in memory at once.
+
+    """
+    if not level:
+        return compress(strip_notebook(content).encode('utf-8'), level)
+
+    crc = 0
+    size = 0
+    sha = hashlib.sha256()
+    compressor = new_compressor(level)
+    data = []
+
+    def write(chunk: bytes) -> None:
+        nonlocal crc, size
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+        sha.update(chunk)
+        data.append(compressor.compress(chunk))
+
+    stream_stripped(content, write)
+    data.append(compressor.flush())
+    compressed = b''.join(data)
+    if len(compressed) >= size:
+        return compress(strip_notebook(content).encode('utf-8'), 0)
+    return crc, size, ZIP_DEFLATED, compressed, sha.hexdigest()
+
+
+class ZipWriter:
+    """
+    Write a zip file of entries whose data is already compressed.
+
+    `ZipFile` can only write data it compresses itself, so this writes the
+    local headers, central directory and end record itself, laid out as
+    `ZipFile` does. It lets the same compressed data go into several
+    archives. ZIP64 is not needed for sample archives and not supported.
+
+    Parameters
+    ----------
+    path : str
+        Path of the zip file to create
+
+    """
+
+    def __init__(self, path: str):
+        self.fp = open(path, 'wb')
+        self.filelist: List[ZipInfo] = []
+        self.names: Set[str] = set()
+
+    @staticmethod
+    def dos_date_time(info: ZipInfo) -> Tuple[int, int]:
+        year, month, day, hour, minute, second = info.date_time
+        return (
+            (year - 1980) << 9 | month << 5 | day,
+            hour << 11 | minute << 5 | second // 2,
+        )
+
+    @staticmethod
+    def encoded_name(info: ZipInfo) -> Tuple[bytes, int]:
+        """Return the encoded file name and the flags that go with it."""
+        try:
+            return info.filename.encode('ascii'), info.flag_bits
+        except UnicodeEncodeError:
+            return info.filename.encode('utf-8'), info.flag_bits | ZIP_UTF8_FLAG
+
+    def write(self, info: ZipInfo, entry: CompressedEntry) -> None:
+        """Add an entry with the name and attributes of `info`."""
+        if info.filename in self.names:
+            raise ValueError(f'duplicate name in zip file: {info.filename}')
+
+        info = copy.copy(info)
+        info.CRC, info.file_size, info.compress_type, data, _ = entry
+        info.compress_size = len(data)
+        info.flag_bits = 0
+        info.header_offset = self.fp.tell()
+        if max(info.file_size, info.compress_size, info.header_offset) > ZIP64_LIMIT:
+            raise LargeZipFile(f'{info.filename} would require ZIP64 extensions')
+
+        dosdate, dostime = self.dos_date_time(info)
+        filename, flag_bits = self.encoded_name(info)
+        self.fp.write(struct.pack(
+            '<4s2B4HL2L2H', b'PK\x03\x04',
+            info.extract_version, info.reserved, flag_bits, info.compress_type,
+            dostime, dosdate, info.CRC, info.compress_size, info.file_size,
+            len(filename), len(info.extra),
+        ))
+        self.fp.write(filename)
+        self.fp.write(info.extra)
+        self.fp.write(data)
+        self.filelist.append(info)
+        self.names.add(info.filename)
+
+    def close(self) -> None:
+        """Write the central directory and end record and close the file."""
+        start = self.fp.tell()
+        for info in self.filelist:
+            dosdate, dostime = self.dos_date_time(info)
+            filename, flag_bits = self.encoded_name(info)
+            self.fp.write(struct.pack(
+                '<4s4B4HL2L5H2L', b'PK\x01\x02',
+                info.create_version, info.create_system, info.extract_version,
+                info.reserved, flag_bits, info.compress_type, dostime, dosdate,
+                info.CRC, info.compress_size, info.file_size,
+                len(filename), len(info.extra), len(info.comment),
+                0, info.internal_attr, info.external_attr, info.header_offset,
+            ))
+            self.fp.write(filename)
+            self.fp.write(info.extra)
+            self.fp.write(info.comment)
+        end = self.fp.tell()
+        if len(self.filelist) > 0xffff or end > ZIP64_LIMIT:
+            raise LargeZipFile('zip file would require ZIP64 extensions')
+        self.fp.write(struct.pack(
+            '<4s4H2LH', b'PK\x05\x06',
+            0, 0, len(self.filelist), len(self.filelist), end - start, start, 0,
+        ))
+        self.fp.close()
+
+
+def verify_zip(path: str) -> None:
+    """Read back every entry of the zip file at `path` and check its CRC."""
+    with ZipFile(path) as archive:
+        bad = archive.testzip()
+    if bad is not None:
+        raise BadZipFile(f'{path}: bad CRC or header for {bad}')
+
+
+def read_compressed(archive: ZipFile, name: str, digest: str) -> CompressedEntry:
+    """Return the entry `name` of `archive` without decompressing it."""
+
+    info = archive.getinfo(name)
+    assert archive.fp is not None
+    archive.fp.seek(info.header_offset)
+    # Local file header: signature, 22 bytes of fields, and the lengths
+    # of the file name and extra field that precede the data
+    header = archive.fp.read(30)
+    if header[:4] != b'PK\x03\x04':
+        raise BadZipFile(f'bad local header for {name}')
+    name_length, extra_length = struct.unpack('<HH', header[26:30])
+    archive.fp.seek(info.header_offset + 30 + name_length + extra_length)
+    data = archive.fp.read(info.compress_size)
+    return info.CRC, info.file_size, info.compress_type, data, digest
+
+
+def parse_compression(values: List[str]) -> Dict[str, int]:
+    """Parse `LEVEL` and `.EXT=LEVEL` options into a level per extension."""
+
+    levels = dict(DEFAULT_COMPRESSION)
+    for value in values:
+        extension, _, level = value.rpartition('=')
+        levels[extension.lower()] = int(level)
+    return levels
+
+
+def compression_level(path: str, levels: Dict[str, int]) -> int:
+    extension = os.path.splitext(path)[1].lower()
+    return levels.get(extension, levels[''])
 
 
 def get_valid_notebooks(notebooks: str, notebooks_directory: str) -> list[str]:
@@ -78,6 +322,441 @@ def convert_to_destination_path(path: str) -> str:
     return '/'.join(filtered_parts)
 
 
+def manifest_path(outfile: str) -> str:
+    """Return the path of the manifest written next to `outfile`."""
+    return os.path.splitext(outfile)[0] + '.manifest.json'
+
+
+def catalog_path(outfile: str) -> str:
+    """Return the path of the catalog index written next to `outfile`."""
+    return os.path.splitext(outfile)[0] + '.catalog.json'
+
+
+def delta_path(outfile: str) -> str:
+    """Return the path of the delta archive written next to `outfile`."""
+    root, ext = os.path.splitext(outfile)
+    return f'{root}-delta{ext}'
+
+
+def digest_path(outfile: str) -> str:
+    """Return the path of the digest file of an archive."""
+    return f'{outfile}.sha256'
+
+
+def write_digest(outfile: str) -> str:
+    """Write the sha256 digest of `outfile` next to it, as sha256sum does."""
+    with open(outfile, 'rb') as infile:
+        digest = hashlib.file_digest(infile, 'sha256').hexdigest()
+    with open(digest_path(outfile), 'w') as out:
+        out.write(f'{digest}  {os.path.basename(outfile)}\n')
+    return digest
+
+
+def reproducible_date_time() -> Tuple[int, int, int, int, int, int]:
+    """Return the timestamp of the entries of reproducible archives."""
+    if 'SOURCE_DATE_EPOCH' not in os.environ:
+        return REPRODUCIBLE_DATE_TIME
+    date_time = time.gmtime(int(os.environ['SOURCE_DATE_EPOCH']))[:6]
+    return max(date_time, REPRODUCIBLE_DATE_TIME)  # type: ignore[return-value]
+
+
+def packager_version() -> str:
+    """Return a digest of this program; entries are only reused within one."""
+    digest = hashlib.sha256()
+    for module in (__file__, nbstrip.__file__):
+        with open(module, 'rb') as infile:
+            digest.update(infile.read())
+    return digest.hexdigest()
+
+
+def write_json(path: str, content: Any) -> None:
+    with open(path, 'w') as outfile:
+        json.dump(content, outfile, indent=2, sort_keys=True)
+        outfile.write('\n')
+
+
+class Archive:
+    """
+    An archive being built, with its manifest.
+
+    The manifest lists, per notebook, a hash of the notebook directory,
+    the digest of the packaged notebook and of every file. Given the
+    manifest of a previous build of the same kind of archive, the
+    compressed entries of unchanged notebooks are copied from it, and a
+    delta archive of the changed notebooks can be written along with a
+    manifest of what was added, changed and removed.
+
+    """
+
+    def __init__(
+        self,
+        outfile: str,
+        strip: bool,
+        levels: Dict[str, int],
+        version: str,
+        base_manifest: Optional[str] = None,
+        delta: bool = False,
+    ):
+        self.outfile = outfile
+        self.strip = strip
+        self.levels = levels
+        self.zip = ZipWriter(outfile)
+        self.stats = dict(
+            entries=0, uncompressed_bytes=0, compressed_bytes=0, reused_notebooks=0,
+        )
+        self.manifest: Dict[str, Any] = dict(
+            archive=os.path.basename(outfile),
+            version=version,
+            strip_outputs=strip,
+            compression=levels,
+            zlib=zlib.ZLIB_RUNTIME_VERSION,
+            notebooks={},
+        )
+        self.digest: Optional[str] = None
+
+        # Uncompressed and compressed bytes of each notebook directory
+        self.sizes: Dict[str, List[int]] = {}
+
+        self.base: Optional[Dict[str, Any]] = None
+        self.base_zip: Optional[ZipFile] = None
+        if base_manifest is not None:
+            with open(base_manifest, 'r') as infile:
+                self.base = json.load(infile)
+            self.base_zip = ZipFile(
+                os.path.join(os.path.dirname(base_manifest), self.base['archive']),
+            )
+
+        self.delta: Optional[ZipWriter] = None
+        if delta and self.base is not None:
+            self.delta = ZipWriter(delta_path(outfile))
+            self.changed: List[str] = []
+
+    def reusable(self, name: str, directory_hash: str) -> bool:
+        """Can the entries of notebook `name` be copied from the base archive?"""
+        return (
+            self.base is not None
+            and self.base['version'] == self.manifest['version']
+            and self.base['compression'] == self.manifest['compression']
+            and self.base.get('zlib') == self.manifest['zlib']
+            and self.base['strip_outputs'] == self.strip
+            and self.base['notebooks'].get(name, {}).get('hash') == directory_hash
+        )
+
+    def base_entry(self, name: str, destination: str) -> CompressedEntry:
+        assert self.base is not None and self.base_zip is not None
+        digest = self.base['notebooks'][name]['files'][destination]
+        return read_compressed(self.base_zip, destination, digest)
+
+    def write(
+        self,
+        name: str,
+        info: ZipInfo,
+        entry: CompressedEntry,
+        changed: bool,
+    ) -> None:
+        self.zip.write(info, entry)
+        if self.delta is not None and changed:
+            self.delta.write(info, entry)
+        self.stats['entries'] += 1
+        self.stats['uncompressed_bytes'] += entry[1]
+        self.stats['compressed_bytes'] += len(entry[3])
+        notebook = self.manifest['notebooks'][name]
+        notebook['files'][info.filename] = entry[4]
+        sizes = self.sizes.setdefault(name, [0, 0])
+        sizes[0] += entry[1]
+        sizes[1] += len(entry[3])
+        if os.path.basename(info.filename) == NOTEBOOK_FILE_NAME:
+            notebook['notebook'] = entry[4]
+
+    def write_catalog(
+        self,
+        metadata: Dict[str, Dict[str, Any]],
+        display: List[str],
+        authors: Dict[str, Dict[str, Any]],
+        date_time: Tuple[int, int, int, int, int, int],
+    ) -> None:
+        """
+        Write the catalog index of the archive to it and next to it.
+
+        `metadata` holds the `meta` section of the meta.toml of each
+        notebook. The catalog is added to the delta archive as well.
+
+        """
+        notebooks = {}
+        for name, notebook in self.manifest['notebooks'].items():
+            size, compressed_size = self.sizes.get(name, [0, 0])
+            notebooks[name] = dict(
+                metadata[name],
+                path=f'{name}/{NOTEBOOK_FILE_NAME}',
+                size=size,
+                compressed_size=compressed_size,
+                hash=notebook['hash'],
+                notebook_sha256=notebook.get('notebook'),
+            )
+        catalog = build_catalog(notebooks, display, authors)
+        content = json.dumps(
+            catalog, sort_keys=True, separators=(',', ':'),
+        ).encode('utf-8')
+
+        with open(catalog_path(self.outfile), 'wb') as out:
+            out.write(content)
+        info = ZipInfo(CATALOG_FILE_NAME, date_time)
+        info.external_attr = REPRODUCIBLE_MODE << 16
+        info.create_system = 3
+        entry = compress(content, compression_level(CATALOG_FILE_NAME, self.levels))
+        self.zip.write(info, entry)
+        if self.delta is not None:
+            self.delta.write(info, entry)
+
+    def close(self) -> None:
+        self.zip.close()
+        verify_zip(self.outfile)
+        self.digest = write_digest(self.outfile)
+        self.manifest['sha256'] = self.digest
+        write_json(manifest_path(self.outfile), self.manifest)
+        if self.base_zip is not None:
+            self.base_zip.close()
+        if self.delta is not None and self.base is not None:
+            self.delta.close()
+            verify_zip(delta_path(self.outfile))
+            old, new = self.base['notebooks'], self.manifest['notebooks']
+            delta_outfile = delta_path(self.outfile)
+            write_json(
+                manifest_path(delta_outfile),
+                dict(
+                    archive=os.path.basename(delta_outfile),
+                    sha256=write_digest(delta_outfile),
+                    base=self.base['archive'],
+                    added=[x for x in self.changed if x not in old],
+                    changed=[x for x in self.changed if x in old],
+                    removed=[x for x in old if x not in new],
+                    notebooks={x: new[x] for x in self.changed},
+                ),
+            )
+
+
+def read_authors(authors_directory: str) -> Dict[str, Dict[str, Any]]:
+    """Return the metadata of every author in `authors_directory` by id."""
+
+    authors = {}
+    if os.path.isdir(authors_directory):
+        for file in sorted(os.listdir(authors_directory)):
+            author_id, ext = os.path.splitext(file)
+            if ext == '.toml':
+                with open(os.path.join(authors_directory, file), 'rb') as f:
+                    authors[author_id] = tomllib.load(f)
+    return authors
+
+
+def build_catalog(
+    notebooks: Dict[str, Dict[str, Any]],
+    display: List[str],
+    authors: Dict[str, Dict[str, Any]],
+) -> Dict[str, Any]:
+    """
+    Return the catalog index of the notebooks of an archive.
+
+    Parameters
+    ----------
+    notebooks : Dict[str, Dict[str, Any]]
+        Catalog entry of each notebook: its `meta` section, path, sizes
+        and hashes
+    display : List[str]
+        Display order of the sample notebooks from the root meta.toml
+    authors : Dict[str, Dict[str, Any]]
+        Author metadata by author id
+
+    Returns
+    -------
+    Dict[str, Any]
+        The catalog, with an inverted index from the values of each of
+        `CATALOG_INDEX_FIELDS` to the sorted names of the notebooks that
+        have them
+
+    """
+
+    index: Dict[str, Dict[str, List[str]]] = {x: {} for x in CATALOG_INDEX_FIELDS}
+    for name in sorted(notebooks):
+        for field in CATALOG_INDEX_FIELDS:
+            values = notebooks[name].get(field, [])
+            if not isinstance(values, list):
+                values = [values]
+            for value in values:
+                index[field].setdefault(value, []).append(name)
+
+    return dict(
+        display=[x for x in display if x in notebooks],
+        notebooks=notebooks,
+        authors={
+            x: authors[x] for x in sorted(index['authors']) if x in authors
+        },
+        index=index,
+    )
+
+
+def read_notebook_directory(
+    path: str,
+    date_time: Optional[Tuple[int, int, int, int, int, int]] = None,
+) -> List[Tuple[str, ZipInfo, bytes]]:
+    """
+    Return the source path, zip info and content of every file in `path`.
+
+    Files in `EXCLUDED_DIRECTORIES` are left out.
+
+    If `date_time` is given, the files are sorted by their name in the
+    archive, and their zip infos get that timestamp and the same
+    permissions instead of those of the files.
+
+    """
+
+    files = []
+    for dirpath, dirs, filenames in os.walk(path):
+        dirs[:] = [x for x in dirs if x not in EXCLUDED_DIRECTORIES]
+        for file in filenames:
+            source = os.path.join(dirpath, file)
+            destination = convert_to_destination_path(source)
+            info = ZipInfo.from_file(source, arcname=destination)
+            if date_time is not None:
+                info.date_time = date_time
+                info.external_attr = REPRODUCIBLE_MODE << 16
+                info.create_system = 3
+            with open(source, 'rb') as infile:
+                files.append((source, info, infile.read()))
+    if date_time is not None:
+        files.sort(key=lambda x: x[1].filename)
+    return files
+
+
+def directory_hash(files: List[Tuple[str, ZipInfo, bytes]]) -> str:
+    """Hash the names and contents of the files of a notebook directory."""
+
+    digest = hashlib.sha256()
+    for _, info, content in sorted(files, key=lambda x: x[1].filename):
+        digest.update(info.filename.encode('utf-8') + b'\0')
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+def build_archives(
+    notebooks_directory: str,
+    notebook_names: List[str],
+    archives: List[Archive],
+    levels: Dict[str, int],
+    jobs: int,
+    reproducible: bool = False,
+    display: Optional[List[str]] = None,
+    authors: Optional[Dict[str, Dict[str, Any]]] = None,
+) -> None:
+    """
+    Write all `archives` in a single pass over the notebook directories.
+
+    Every file is read once. Files are compressed (and notebooks stripped)
+    in a process pool, and each compressed entry is written to all
+    archives that contain it, in order. At most `2 * jobs` compressions
+    are in flight, so the pool stays busy without the contents of every
+    file and its compressed data being held at once. Notebooks that are
+    unchanged since the base archive of an archive are copied from there
+    instead.
+
+    If `reproducible` is set, notebooks and their files are written in
+    sorted order with a fixed timestamp and permissions, so that the same
+    notebooks always give the same archive bytes.
+
+    Each archive ends with a catalog index of its notebooks, built from
+    their meta.toml files, the `display` order and the `authors`.
+
+    """
+
+    date_time = reproducible_date_time() if reproducible else None
+    metadata: Dict[str, Dict[str, Any]] = {}
+    if reproducible:
+        notebook_names = sorted(notebook_names)
+
+    # Files whose entries are not written yet, with their number of futures
+    pending: Deque[
+        Tuple[str, ZipInfo, List[Union[Future, CompressedEntry]], List[bool], int]
+    ] = collections.deque()
+
+    def write_next() -> int:
+        """Write the oldest pending file and return its number of futures."""
+        notebook_name, info, entries, reused, submitted = pending.popleft()
+        for archive, entry, reuse in zip(archives, entries, reused):
+            if isinstance(entry, Future):
+                entry = entry.result()
+            archive.write(notebook_name, info, entry, changed=not reuse)
+        return submitted
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = 0
+        for notebook_name in notebook_names:
+            print(notebook_name)
+
+            notebook_directory_path = os.path.join(
+                notebooks_directory,
+                notebook_name,
+            )
+
+            notebook_path = os.path.join(
+                notebook_directory_path,
+                NOTEBOOK_FILE_NAME,
+            )
+
+            files = read_notebook_directory(notebook_directory_path, date_time)
+            for source, _, content in files:
+                if source == os.path.join(notebook_directory_path, 'meta.toml'):
+                    metadata[notebook_name] = tomllib.loads(
+                        content.decode('utf-8'),
+                    ).get('meta', {})
+            dir_hash = directory_hash(files)
+            reused = []
+            for archive in archives:
+                archive.manifest['notebooks'][notebook_name] = dict(
+                    hash=dir_hash, files={},
+                )
+                reused.append(archive.reusable(notebook_name, dir_hash))
+                if archive.delta is not None and not reused[-1]:
+                    archive.changed.append(notebook_name)
+                if reused[-1]:
+                    archive.stats['reused_notebooks'] += 1
+
+            # write the whole notebook directory
+            for source, info, content in files:
+                level = compression_level(source, levels)
+                variants: Dict[bool, Future] = {}
+                entries: List[Union[Future, CompressedEntry]] = []
+                for archive, reuse in zip(archives, reused):
+                    if reuse:
+                        entries.append(
+                            archive.base_entry(notebook_name, info.filename),
+                        )
+                        continue
+                    strip = archive.strip and source == notebook_path
+                    if strip not in variants:
+                        # write notebook with stripped output
+                        variants[strip] = executor.submit(
+                            strip_and_compress if strip else compress,
+                            content,
+                            level,
+                        )
+                    entries.append(variants[strip])
+                pending.append((notebook_name, info, entries, reused, len(variants)))
+                in_flight += len(variants)
+                while in_flight > 2 * jobs:
+                    in_flight -= write_next()
+
+        while pending:
+            write_next()
+
+    for archive in archives:
+        archive.write_catalog(
+            metadata,
+            display or [],
+            authors or {},
+            date_time or time.localtime()[:6],  # type: ignore[arg-type]
+        )
+        archive.close()
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(
@@ -112,6 +791,52 @@ if __name__ == '__main__':
         default=False,
         action=argparse.BooleanOptionalAction,
     )
+    parser.add_argument(
+        '--stripped-outfile',
+        help='also write an archive with stripped outputs to this file '
+             'in the same pass',
+    )
+    parser.add_argument(
+        '-z', '--compression',
+        help='deflate level (0 stores), for all files or for one '
+             'extension as `.EXT=LEVEL`; may be repeated',
+        default=[],
+        action='append',
+        metavar='[.EXT=]LEVEL',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        help='number of worker processes',
+        type=int,
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        '--authors-directory',
+        help='directory of the author files for the catalog index',
+        default='authors',
+    )
+    parser.add_argument(
+        '--reproducible',
+        help='write entries in sorted order with a fixed timestamp '
+             '(SOURCE_DATE_EPOCH or 1980-01-01) and permissions, so that '
+             'the same notebooks give the same archive',
+        default=False,
+        action=argparse.BooleanOptionalAction,
+    )
+    parser.add_argument(
+        '--base-manifest',
+        help='manifest of a previous build; unchanged notebooks are copied '
+             'from its archive. Give one per archive being built',
+        default=[],
+        action='append',
+    )
+    parser.add_argument(
+        '--delta',
+        help='also write a delta archive and manifest of the notebooks '
+             'changed since the base manifest',
+        default=False,
+        action='store_true',
+    )
 
     args = parser.parse_args()
 
@@ -120,30 +845,57 @@ if __name__ == '__main__':
         notebooks_directory=args.notebooks_directory,
     )
 
-    with ZipFile(args.outfile, 'w') as out:
-        for notebook_name in valid_notebooks:
-            print(notebook_name)
-
-            notebook_directory_path = os.path.join(
-                args.notebooks_directory,
-                notebook_name,
-            )
-
-            notebook_path = os.path.join(
-                notebook_directory_path,
-                NOTEBOOK_FILE_NAME,
+    targets = [(args.outfile, args.strip_outputs)]
+    if args.stripped_outfile:
+        targets.append((args.stripped_outfile, True))
+
+    # Base manifests are matched to the archives by their strip setting
+    base_manifests = {}
+    for path in args.base_manifest:
+        with open(path, 'r') as f:
+            base_manifests[json.load(f)['strip_outputs']] = path
+
+    # The catalog index keeps the display order of the sample notebooks
+    with open(args.toml, 'rb') as infile:
+        display = tomllib.load(infile).get('samples', {}).get('display', [])
+
+    start = time.perf_counter()
+    levels = parse_compression(args.compression)
+    version = packager_version()
+    archives = [
+        Archive(
+            outfile, strip, levels, version,
+            base_manifest=base_manifests.get(strip),
+            delta=args.delta,
+        )
+        for outfile, strip in targets
+    ]
+    build_archives(
+        args.notebooks_directory,
+        valid_notebooks,
+        archives,
+        levels,
+        args.jobs,
+        reproducible=args.reproducible,
+        display=display,
+        authors=read_authors(args.authors_directory),
+    )
+    elapsed = time.perf_counter() - start
+
+    for archive in archives:
+        stat = archive.stats
+        print(
+            f'{archive.outfile}: {stat["entries"]} entries, '
+            f'{stat["uncompressed_bytes"]:,} bytes uncompressed, '
+            f'{stat["compressed_bytes"]:,} compressed, '
+            f'{os.path.getsize(archive.outfile):,} on disk, '
+            f'{stat["reused_notebooks"]} notebooks reused, '
+            f'sha256 {archive.digest}',
+        )
+        if archive.delta is not None:
+            delta_outfile = delta_path(archive.outfile)
+            print(
+                f'{delta_outfile}: {len(archive.changed)} changed notebooks, '
+                f'{os.path.getsize(delta_outfile):,} on disk',
             )
-
-            # write the whole notebook directory
-            for dirpath, dirs, files in os.walk(notebook_directory_path):
-                for file in files:
-                    source = os.path.join(dirpath, file)
-                    destination = convert_to_destination_path(source)
-
-                    if source == notebook_path and args.strip_outputs:
-                        # write notebook with stripped output
-                        stripped_nodebook = strip_outputs(notebook_path)
-                        out.writestr(destination, stripped_nodebook)
-                    else:
-                        # write file normally
-                        out.write(source, arcname=destination)
+    print(f'built {len(targets)} archive(s) in {elapsed:.2f}s')
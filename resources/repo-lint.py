@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""Check all notebook, author and lesson metadata of the repository."""
+import sys
+
+from nblint import main
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""Benchmark how the notebook tooling scales over synthetic corpora."""
+import argparse
+import base64
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from nblint import AUTHOR_IMAGES_DIRECTORY
+from nblint import CARD_ICONS_DIRECTORY
+from nblint import kebab_case
+from nblint import PREVIEW_ICONS_DIRECTORY
+
+RESOURCES = os.path.dirname(os.path.abspath(__file__))
+
+# Version of the results file format
+RESULTS_VERSION = 1
+
+AUTHOR = 'singlestore'
+LESSON_AREA = 'Kai'
+ICON = 'database'
+
+
+def png_payload(size: int, rng: random.Random) -> str:
+    """Return base64 data of about `size` bytes, standing in for an image."""
+    return base64.b64encode(rng.randbytes(size * 3 // 4)).decode('ascii')
+
+
+def synthetic_notebook(
+    cells: int,
+    output_size: int,
+    image_size: int,
+    rng: random.Random,
+) -> Dict[str, Any]:
+    """
+    Return a notebook as an author would save it, before normalization.
+
+    Every other cell is a code cell with a text output of `output_size`
+    bytes and, if `image_size` is set, a PNG output of that many bytes.
+
+    """
+    nb_cells: List[Dict[str, Any]] = []
+    for i in range(cells):
+        if i % 2 == 0:
+            nb_cells.append({
+                'cell_type': 'markdown',
+                'metadata': {},
+                'source': [f'## Step {i // 2 + 1}\n', '\n', 'Some text.  '],
+            })
+            continue
+        outputs: List[Dict[str, Any]] = []
+        if output_size:
+            line = 'x' * 79 + '\n'
+            outputs.append({
+                'name': 'stdout',
+                'output_type': 'stream',
+                'text': [line] * max(1, output_size // len(line)),
+            })
+        if image_size:
+            outputs.append({
+                'data': {
+                    'image/png': png_payload(image_size, rng),
+                    'text/plain': ['<Figure size 640x480 with 1 Axes>'],
+                },
+                'metadata': {},
+                'output_type': 'display_data',
+            })
+        nb_cells.append({
+            'cell_type': 'code',
+            'execution_count': rng.randint(1, 100),
+            'metadata': {'execution': {'iopub.status.busy': '2024-01-01'}},
+            'outputs': outputs,
+            'source': [f'result = compute({i})\n', 'print(result)'],
+        })
+    return {
+        'cells': nb_cells,
+        'metadata': {
+            'kernelspec': {
+                'display_name': 'Python 3 (ipykernel)',
+                'language': 'python',
+                'name': 'python3',
+            },
+        },
+        'nbformat': 4,
+        'nbformat_minor': 5,
+    }
+
+
+def synthetic_meta(i: int) -> str:
+    return '\n'.join([
+        '[meta]',
+        f'authors=["{AUTHOR}"]',
+        f'title="Synthetic notebook {i}"',
+        'description="""A generated notebook for benchmarks."""',
+        f'icon="{ICON}"',
+        'difficulty="beginner"',
+        'tags=["benchmark"]',
+        f'lesson_areas=["{LESSON_AREA}"]',
+        'destinations=["spaces"]',
+        'minimum_tier="free-shared"',
+        '',
+    ])
+
+
+def write_file(path: str, content: Any) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb' if isinstance(content, bytes) else 'w') as outfile:
+        outfile.write(content)
+
+
+def generate_corpus(
+    root: str,
+    notebooks: int,
+    cells: int,
+    output_size: int,
+    image_size: int,
+    seed: int = 0,
+) -> Tuple[List[str], int]:
+    """
+    Write a synthetic repository with `notebooks` notebooks under `root`.
+
+    A copy of each notebook file is kept in `root`/authored, so that
+    notebooks normalized by a run can be restored; they are not kept in
+    memory, as every tool run would count them in its peak memory.
+
+    Returns
+    -------
+    Tuple[List[str], int]
+        The paths of the notebook files and their total size
+
+    """
+    rng = random.Random(seed)
+    names = [f'synthetic-{i:05d}' for i in range(notebooks)]
+    icon = png_payload(256, rng).encode('ascii')
+    for directory in [CARD_ICONS_DIRECTORY, PREVIEW_ICONS_DIRECTORY]:
+        write_file(
+            os.path.join(root, directory, f'{kebab_case(LESSON_AREA)}.png'), icon,
+        )
+    write_file(os.path.join(root, AUTHOR_IMAGES_DIRECTORY, f'{AUTHOR}.png'), icon)
+    write_file(
+        os.path.join(root, 'authors', f'{AUTHOR}.toml'),
+        f'name="SingleStore"\ntitle="Engineering Team"\nimage="{AUTHOR}"\n'
+        f'external=false\n',
+    )
+    write_file(
+        os.path.join(root, 'meta.toml'),
+        '[samples]\ndisplay = [\n' + ''.join(f'  "{x}",\n' for x in names[:9]) + ']\n',
+    )
+
+    paths = []
+    size = 0
+    for i, name in enumerate(names):
+        directory = os.path.join(root, 'notebooks', name)
+        nb = synthetic_notebook(cells, output_size, image_size, rng)
+        content = (json.dumps(nb, indent=1) + '\n').encode('utf-8')
+        path = os.path.join(directory, 'notebook.ipynb')
+        write_file(path, content)
+        write_file(os.path.join(root, 'authored', f'{name}.ipynb'), content)
+        write_file(os.path.join(directory, 'meta.toml'), synthetic_meta(i))
+        paths.append(path)
+        size += len(content)
+    return paths, size
+
+
+def run_tool(argv: List[str], cwd: str) -> Tuple[float, int]:
+    """Run a tool and return its wall time and peak memory in KB."""
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, *argv], cwd=cwd,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    assert proc.stderr is not None
+    stderr = proc.stderr.read()
+    # The peak memory of this child (and the workers it waited for)
+    _, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise RuntimeError(
+            f'{" ".join(argv[:1])} failed ({proc.returncode}): '
+            f'{stderr.decode("utf-8", "replace")[-2000:]}',
+        )
+    return seconds, usage.ru_maxrss
+
+
+def tools(root: str, jobs: int) -> List[Tuple[str, List[str], Optional[str]]]:
+    """
+    Return the name, command line and preparation of every benchmarked run.
+
+    Runs prepared with 'restore' start from the notebooks as authored, and
+    runs prepared with 'warm' are run once before they are timed.
+
+    """
+    notebooks = sorted(
+        os.path.join('notebooks', x, 'notebook.ipynb')
+        for x in os.listdir(os.path.join(root, 'notebooks'))
+    )
+    metas = [os.path.join(os.path.dirname(x), 'meta.toml') for x in notebooks]
+    nb_check = os.path.join(RESOURCES, 'nb-check.py')
+    cache = os.path.join(root, '.nb-check-cache.json')
+    return [
+        # Notebooks as authors save them, normalized and written back
+        (
+            'nb-check normalize',
+            [nb_check, '-j', str(jobs), '--no-cache', *notebooks],
+            'restore',
+        ),
+        # Notebooks already in canonical form, as in CI
+        (
+            'nb-check check',
+            [nb_check, '-j', str(jobs), '--no-cache', '--check', *notebooks],
+            None,
+        ),
+        (
+            'nb-check cached',
+            [nb_check, '-j', str(jobs), '--cache', cache, '--check', *notebooks],
+            'warm',
+        ),
+        (
+            'nb-meta-check',
+            [os.path.join(RESOURCES, 'nb-meta-check.py'), *metas],
+            None,
+        ),
+        (
+            'package-samples',
+            [
+                os.path.join(RESOURCES, 'package-samples.py'), 'notebooks',
+                '--notebooks', 'all', '-j', str(jobs), '--reproducible',
+                '-o', os.path.join(root, 'out', 'sample-notebooks.zip'),
+                '--stripped-outfile',
+                os.path.join(root, 'out', 'sample-notebooks-stripped.zip'),
+            ],
+            None,
+        ),
+    ]
+
+
+def benchmark_corpus(
+    root: str,
+    count: int,
+    args: argparse.Namespace,
+) -> List[Dict[str, Any]]:
+    """Generate a corpus of `count` notebooks and time every tool on it."""
+    paths, corpus_bytes = generate_corpus(
+        root, count, args.cells, args.output_size, args.image_size, args.seed,
+    )
+    os.makedirs(os.path.join(root, 'out'), exist_ok=True)
+
+    results = []
+    for name, argv, prepare in tools(root, args.jobs):
+        if args.tool and not any(x in name for x in args.tool):
+            continue
+        if prepare == 'warm':
+            run_tool(argv, root)
+        best, peak = float('inf'), 0
+        for _ in range(args.repeat):
+            if prepare == 'restore':
+                for path in paths:
+                    nb_dir = os.path.basename(os.path.dirname(path))
+                    shutil.copyfile(
+                        os.path.join(root, 'authored', f'{nb_dir}.ipynb'), path,
+                    )
+            seconds, rss = run_tool(argv, root)
+            best, peak = min(best, seconds), max(peak, rss)
+        results.append(dict(
+            tool=name,
+            notebooks=count,
+            cells=args.cells,
+            output_size=args.output_size,
+            image_size=args.image_size,
+            corpus_bytes=corpus_bytes,
+            wall_s=round(best, 6),
+            peak_rss_kb=peak,
+            per_notebook_ms=round(best / count * 1e3, 4),
+        ))
+        print(
+            f'{name:<20} {count:>9} {corpus_bytes / 1e6:7.1f}MB {best:8.2f}s '
+            f'{peak / 1e3:8.0f}MB {best / count * 1e3:10.2f}ms',
+            flush=True,
+        )
+    return results
+
+
+def cost_curves(results: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """
+    Split the time of each tool into a fixed and a per-notebook cost.
+
+    The costs are a least-squares line through wall time against the
+    number of notebooks, over all corpus sizes.
+
+    """
+    curves = {}
+    for tool in dict.fromkeys(x['tool'] for x in results):
+        points = [(x['notebooks'], x['wall_s']) for x in results if x['tool'] == tool]
+        if len(points) < 2:
+            continue
+        mean_n = sum(n for n, _ in points) / len(points)
+        mean_t = sum(t for _, t in points) / len(points)
+        var = sum((n - mean_n) ** 2 for n, _ in points)
+        slope = sum((n - mean_n) * (t - mean_t) for n, t in points) / var if var else 0
+        curves[tool] = dict(
+            fixed_s=round(mean_t - slope * mean_n, 6),
+            per_notebook_ms=round(slope * 1e3, 4),
+        )
+    return curves
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=RESOURCES,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(
+    results: List[Dict[str, Any]],
+    path: str,
+    threshold: float,
+) -> int:
+    """Print the change against earlier results; return the number of regressions."""
+    with open(path, 'r') as infile:
+        previous = json.load(infile)
+    if previous.get('version') != RESULTS_VERSION:
+        print(f'\n{path} has results version {previous.get("version")}; not compared')
+        return 0
+
+    def key(x: Dict[str, Any]) -> Tuple[Any, ...]:
+        return tuple(
+            x[k] for k in ['tool', 'notebooks', 'cells', 'output_size', 'image_size']
+        )
+
+    before = {key(x): x for x in previous['results']}
+    regressions = 0
+    print(f'\ncompared with {path} ({previous.get("commit") or "unknown commit"})')
+    print(f'{"tool":<20} {"notebooks":>9} {"time":>8} {"memory":>8}')
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        time_ratio = result['wall_s'] / old['wall_s']
+        memory_ratio = result['peak_rss_kb'] / old['peak_rss_kb']
+        regressed = time_ratio > 1 + threshold or memory_ratio > 1 + threshold
+        regressions += regressed
+        print(
+            f'{result["tool"]:<20} {result["notebooks"]:>9} {time_ratio:7.2f}x '
+            f'{memory_ratio:7.2f}x{"  REGRESSION" if regressed else ""}',
+        )
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        '-n', '--notebooks', default='10,100,1000',
+        help='comma-separated corpus sizes, in notebooks',
+    )
+    parser.add_argument('--cells', type=int, default=20, help='cells per notebook')
+    parser.add_argument(
+        '--output-size', type=int, default=2000,
+        help='bytes of text output per code cell',
+    )
+    parser.add_argument(
+        '--image-size', type=int, default=20000,
+        help='bytes of PNG output per code cell (0 for none)',
+    )
+    parser.add_argument(
+        '-t', '--tool', action='append', default=[],
+        help='only run the tools whose name contains this; may be repeated',
+    )
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count())
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument(
+        '--compare', metavar='RESULTS',
+        help='JSON results of an earlier run to compare with',
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='relative slowdown or memory growth reported as a regression',
+    )
+    parser.add_argument(
+        '--keep', metavar='DIRECTORY',
+        help='generate the corpora in this directory and keep them',
+    )
+    args = parser.parse_args()
+
+    counts = [int(x) for x in args.notebooks.split(',')]
+    base = args.keep or tempfile.mkdtemp(prefix='scale-bench-')
+
+    print(
+        f'{"tool":<20} {"notebooks":>9} {"corpus":>9} {"wall":>9} {"peak":>10} '
+        f'{"per notebook":>12}',
+    )
+    results: List[Dict[str, Any]] = []
+    try:
+        for count in counts:
+            root = os.path.join(base, f'corpus-{count}')
+            shutil.rmtree(root, ignore_errors=True)
+            results.extend(benchmark_corpus(root, count, args))
+    finally:
+        if not args.keep:
+            shutil.rmtree(base, ignore_errors=True)
+
+    curves = cost_curves(results)
+    if curves:
+        print(f'\n{"tool":<20} {"fixed":>9} {"per notebook":>12}')
+        for tool, curve in curves.items():
+            print(
+                f'{tool:<20} {curve["fixed_s"]:8.2f}s '
+                f'{curve["per_notebook_ms"]:10.2f}ms',
+            )
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(
+                dict(
+                    version=RESULTS_VERSION,
+                    created=datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                    commit=git_commit(),
+                    python=platform.python_version(),
+                    platform=platform.platform(),
+                    cpus=os.cpu_count(),
+                    parameters=dict(
+                        notebooks=counts,
+                        cells=args.cells,
+                        output_size=args.output_size,
+                        image_size=args.image_size,
+                        jobs=args.jobs,
+                        repeat=args.repeat,
+                        seed=args.seed,
+                    ),
+                    results=results,
+                    cost_curves=curves,
+                ),
+                outfile,
+                indent=2,
+            )
+            outfile.write('\n')
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)